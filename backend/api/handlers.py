@@ -13,7 +13,7 @@ from api.schemas import SlideshowRequest, SlideshowResponse, SlideshowStatusResp
 # TODO: Import services once implemented
 from core.config import settings
 from services import face_embedding_service as emb
-from services.slideshow_service import job_status_store, process_slideshow
+from services.slideshow_service import get_job_status, process_slideshow, set_job_status
 from services.caption_service import (
     generate_caption,
     fetch_event_media_mapping,
@@ -95,12 +95,13 @@ async def generate_slideshow(
     user_id = 1  # PLACEHOLDER - should be extracted from JWT token
     
     # Initialize job status
-    job_status_store[job_id] = {
-        "status": "processing",
-        "message": "Starting slideshow generation...",
-        "slideshow_url": None,
-        "error": None
-    }
+    await set_job_status(
+        job_id,
+        status="processing",
+        message="Starting slideshow generation...",
+        slideshow_url=None,
+        error=None,
+    )
     
     # Start background processing using asyncio.create_task for true non-blocking execution
     asyncio.create_task(process_slideshow(job_id, request, user_id))
@@ -120,11 +121,10 @@ async def get_slideshow_status(job_id: str):
     Get the current status of a slideshow generation job.
     Frontend should poll this endpoint every 5 seconds.
     """
-    if job_id not in job_status_store:
+    status = await get_job_status(job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    
-    status = job_status_store[job_id]
-    return SlideshowStatusResponse(**status)
+    return SlideshowStatusResponse.model_validate(status, from_attributes=True)
 
 @router.get("/health")
 async def health_check():
@@ -317,36 +317,36 @@ async def get_event_media_mapping_endpoint(event_id: int):
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/event/{event_id}/generate-captions")
-async def generate_event_captions_endpoint(event_id: int, theme: str = "playful"):
+async def generate_event_captions_endpoint(event_id: int, theme: str = "playful", force: bool = False):
     """
     Generate captions for all media in an event using tagged user names and metadata.
+    Media that already have an ai_caption are skipped unless force=true.
     """
     try:
         # Use the caption service function
         captions = await generate_event_captions_batch(
             event_id=event_id,
             theme=theme,
-            update_database=True
+            update_database=True,
+            force=force
         )
         
-        # Fetch media items again to get media_ids for response
-        media_items = await fetch_event_media_mapping(event_id)
-        
         # Build detailed response matching original format
         generated_captions = []
-        for media, caption_data in zip(media_items, captions):
-            tagged_users = [u["username"] for u in (media.get("tagged_users") or [])]
+        for caption_data in captions:
             generated_captions.append({
-                "media_id": media["media_id"],
+                "media_id": caption_data["media_id"],
                 "file_url": caption_data["image_url"],
                 "ai_caption": caption_data["caption"],
-                "tagged_users": tagged_users
+                "tagged_users": caption_data["tagged_users"]
             })
+        generated = sum(1 for c in captions if c["generated"])
         
         return {
             "status": "success",
             "event_id": event_id,
-            "captions_generated": len(generated_captions),
+            "captions_generated": generated,
+            "captions_reused": len(captions) - generated,
             "captions": generated_captions
         }
     
@@ -6,6 +6,9 @@ class Settings(BaseSettings):
     AZURE_OPENAI_API_KEY: str = ''
     AZURE_OPENAI_ENDPOINT: str = ''
     AZURE_OPENAI_DEPLOYMENT: str = ''
+    # Deployment quota used for client-side rate limiting of caption requests
+    AZURE_OPENAI_RPM: int = 60
+    AZURE_OPENAI_MIN_REMAINING_TOKENS: int = 1000
 
     AZURE_STORAGE_ACCOUNT: str = os.getenv("AZURE_STORAGE_ACCOUNT", "")
     AZURE_STORAGE_KEY: str = os.getenv("AZURE_STORAGE_KEY", "")
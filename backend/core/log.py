@@ -0,0 +1,43 @@
+"""Non-blocking logging setup.
+
+Log records are pushed onto an in-memory queue and written to stdout by a
+background QueueListener thread, so logging from async code never blocks the
+event loop on a stdout write/flush.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Optional
+
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_lock = threading.Lock()
+
+
+def _get_queue_handler() -> logging.handlers.QueueHandler:
+    global _queue_handler
+    with _lock:
+        if _queue_handler is None:
+            log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+            listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+            listener.start()
+            # Drain any queued records on interpreter shutdown
+            atexit.register(listener.stop)
+            _queue_handler = logging.handlers.QueueHandler(log_queue)
+    return _queue_handler
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger whose records are emitted through the background queue listener."""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        logger.addHandler(_get_queue_handler())
+        logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        logger.propagate = False
+    return logger
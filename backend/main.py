@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from typing import Union
 import os
 from pathlib import Path
@@ -49,12 +50,27 @@ except Exception:
     pass
 
 from api.handlers import router as api_router
+from services import caption_service, face_embedding_service, music_service, slideshow_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await face_embedding_service.warmup()
+    yield
+    # Close pooled HTTP clients on shutdown
+    await face_embedding_service.close_client()
+    await slideshow_service.close_http_client()
+    await caption_service.close_http_client()
+    await music_service.close_client()
+    # and stop the image preprocessing worker processes
+    slideshow_service.shutdown_preprocess_pool()
 
 
 app = FastAPI(
     title="Dumpy Backend API",
     description="AI-powered slideshow generation service",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS for frontend dev (Expo/web)
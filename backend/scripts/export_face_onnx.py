@@ -0,0 +1,38 @@
+"""Export the InceptionResnetV1 (vggface2) face embedder to ONNX.
+
+Run from the backend directory:
+
+    python -m scripts.export_face_onnx [output_path]
+
+The default output is data/face_resnet.onnx, which FaceEmbedder picks up
+automatically when onnxruntime is installed (see FACE_ONNX_PATH). With
+onnxruntime-gpu the TensorRT / CUDA execution providers are used and built
+TensorRT engines are cached next to the model.
+"""
+
+import sys
+
+import torch
+from facenet_pytorch import InceptionResnetV1
+
+from services.face_embedding_service import FACE_ONNX_PATH
+
+
+def main() -> None:
+    out = sys.argv[1] if len(sys.argv) > 1 else str(FACE_ONNX_PATH)
+    model = InceptionResnetV1(pretrained="vggface2").eval()
+    dummy = torch.zeros(1, 3, 160, 160)
+    torch.onnx.export(
+        model,
+        dummy,
+        out,
+        input_names=["faces"],
+        output_names=["embeddings"],
+        dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+        opset_version=17,
+    )
+    print(f"Exported face embedder to {out}")
+
+
+if __name__ == "__main__":
+    main()
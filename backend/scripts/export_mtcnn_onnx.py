@@ -0,0 +1,50 @@
+"""Export the MTCNN P-, R- and O-nets used for face detection to ONNX.
+
+Run from the backend directory:
+
+    python -m scripts.export_mtcnn_onnx [output_dir]
+
+Writes pnet.onnx, rnet.onnx and onet.onnx to output_dir (default:
+FACE_MTCNN_ONNX_DIR). Set FACE_ONNX_MTCNN=1 to have FaceEmbedder
+run them through onnxruntime. P-net is exported with dynamic height/width since
+it runs over every level of the image pyramid.
+"""
+
+import sys
+from pathlib import Path
+
+import torch
+from facenet_pytorch import MTCNN
+
+from services.face_embedding_service import FACE_MTCNN_ONNX_DIR
+
+
+def _export(net: torch.nn.Module, dummy: torch.Tensor, out: Path, output_names, spatial: bool) -> None:
+    axes = {0: "batch", 2: "height", 3: "width"} if spatial else {0: "batch"}
+    dynamic_axes = {"input": axes}
+    for name in output_names:
+        dynamic_axes[name] = axes if spatial else {0: "batch"}
+    torch.onnx.export(
+        net.eval(),
+        dummy,
+        str(out),
+        input_names=["input"],
+        output_names=output_names,
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+    )
+    print(f"Exported {out}")
+
+
+def main() -> None:
+    out_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else FACE_MTCNN_ONNX_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+    mtcnn = MTCNN(device="cpu")
+    # Output order matches each module's forward(): (box regression, [landmarks,] probabilities)
+    _export(mtcnn.pnet, torch.zeros(1, 3, 48, 48), out_dir / "pnet.onnx", ["reg", "prob"], spatial=True)
+    _export(mtcnn.rnet, torch.zeros(1, 3, 24, 24), out_dir / "rnet.onnx", ["reg", "prob"], spatial=False)
+    _export(mtcnn.onet, torch.zeros(1, 3, 48, 48), out_dir / "onet.onnx", ["reg", "landmarks", "prob"], spatial=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
 from openai import AsyncAzureOpenAI
+from aiolimiter import AsyncLimiter
+import httpx
+from fastjsonschema import compile as compile_schema, JsonSchemaException
 from core.config import settings
+from core.log import get_logger
 from supabase import create_client, Client
-from typing import List, Dict, Optional
-import json
+from typing import List, Dict, Optional, Tuple
+from collections import Counter, defaultdict
+from PIL import Image
+from functools import lru_cache
+import asyncio
+import base64
+import io
+import re
+import time
+import orjson
+
+logger = get_logger("caption_service")
 
 client = AsyncAzureOpenAI(
     api_key=settings.AZURE_OPENAI_API_KEY,
@@ -10,6 +24,95 @@ client = AsyncAzureOpenAI(
     api_version="2024-12-01-preview",
 )
 
+# Client-side pacing sized to the deployment's quota, so concurrent caption
+# batches run at the deployment ceiling instead of tripping 429s
+_request_limiter = AsyncLimiter(max_rate=settings.AZURE_OPENAI_RPM, time_period=60)
+# Monotonic time before which no new request is sent (token budget exhausted)
+_token_budget_resume_at = 0.0
+_DEFAULT_TOKEN_RESET_SECONDS = 10.0
+
+# Shared client for fetching images to inline, so every batch reuses pooled
+# HTTP/2 connections to the storage host instead of handshaking per batch
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(http2=True, timeout=30.0)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Images are inlined as JPEGs no larger than this on either side (the model sees
+# ~1k px at most anyway), with at most _IMAGE_FETCH_CONCURRENCY downloads in flight
+# across all batches so large events don't hold every original in memory at once
+_INLINE_IMAGE_MAX_SIDE = 1024
+_INLINE_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+_IMAGE_FETCH_CONCURRENCY = 8
+_image_fetch_slots = asyncio.Semaphore(_IMAGE_FETCH_CONCURRENCY)
+
+
+def _parse_reset_seconds(value: Optional[str]) -> float:
+    """Parse an x-ratelimit-reset-* header ("20ms", "1s", "6m0s" or plain seconds)."""
+    if not value:
+        return _DEFAULT_TOKEN_RESET_SECONDS
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts:
+        return _DEFAULT_TOKEN_RESET_SECONDS
+    return sum(float(n) * units[u] for n, u in parts)
+
+
+def _update_token_budget(headers) -> None:
+    """Pause new requests until reset when the remaining token budget runs low."""
+    global _token_budget_resume_at
+    try:
+        remaining = int(headers.get("x-ratelimit-remaining-tokens"))
+    except (TypeError, ValueError):
+        return
+    if remaining < settings.AZURE_OPENAI_MIN_REMAINING_TOKENS:
+        reset = _parse_reset_seconds(headers.get("x-ratelimit-reset-tokens"))
+        _token_budget_resume_at = max(_token_budget_resume_at, time.monotonic() + reset)
+        logger.warning("Token budget low (%d remaining); pausing requests for %.1fs", remaining, reset)
+
+
+_SYSTEM_TEMPLATE = (
+    "You create short, witty (<=25 words) captions for group stories with a {theme} tone.\n"
+    "Use provided names exactly as given; do NOT guess or invent names.\n"
+    "Include people if relevant, reference the location naturally, "
+    "and capture the {theme} vibe in your writing style.\n"
+    "Avoid filler like 'in this photo'.\n"
+    "Return ONLY JSON: {{\"caption\": \"...\"}}."
+)
+
+
+_FALLBACK_CAPTION = "Moment captured."
+
+# Compiled once; validates the model's JSON output without exception-driven parsing
+_validate_caption = compile_schema({
+    "type": "object",
+    "properties": {"caption": {"type": "string", "maxLength": 250}},
+    "required": ["caption"],
+})
+
+
+@lru_cache(maxsize=16)
+def _system_message(theme: str) -> Dict[str, str]:
+    """System message for a theme, built once and shared (treat as read-only)."""
+    return {"role": "system", "content": _SYSTEM_TEMPLATE.format(theme=theme)}
+
+
 # Initialize Supabase client
 supabase: Client = create_client(
     settings.SUPABASE_URL,
@@ -19,10 +122,20 @@ supabase: Client = create_client(
 async def generate_caption(image_url: str,
                            tagged_names: list[str] | None = None,
                            location: str | None = None,
-                           theme: str = "playful"):
+                           theme: str = "playful",
+                           event_id: int | None = None,
+                           image_data_url: str | None = None):
     """
     Generate a short caption for an image using Azure OpenAI.
     This version integrates with the /event/{id}/generate-captions endpoint.
+
+    When event_id is given, a per-event prompt_cache_key is sent so every call
+    in the event's batch is routed to the same warm prompt cache. The system
+    prompt is byte-identical across those calls and the image is sent last,
+    keeping the shared prefix as long as possible.
+
+    If image_data_url (a base64 data: URI) is given it is sent instead of
+    image_url, so Azure does not have to fetch the image itself.
     """
     tagged_names = tagged_names or []
 
@@ -34,39 +147,47 @@ async def generate_caption(image_url: str,
         "theme": theme,
     }
 
-    SYSTEM_PROMPT = (
-        f"You create short, witty (<=25 words) captions for group stories with a {theme} tone.\n"
-        "Use provided names exactly as given; do NOT guess or invent names.\n"
-        "Include people if relevant, reference the location naturally, "
-        f"and capture the {theme} vibe in your writing style.\n"
-        "Avoid filler like 'in this photo'.\n"
-        "Return ONLY JSON: {\"caption\": \"...\"}."
-    )
+    extra_body = None
+    if event_id is not None:
+        extra_body = {"prompt_cache_key": f"event-{event_id}-theme-{theme}"}
 
     try:
-        resp = await client.chat.completions.create(
-            model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": json.dumps(user_payload)},
-                        {"type": "image_url", "image_url": {"url": image_url}},
-                    ],
-                },
-            ],
-            temperature=0.6,
-            top_p=0.9,
-            max_tokens=120,
-            response_format={"type": "json_object"},
-        )
-
-        data = json.loads(resp.choices[0].message.content)
-        return data.get("caption", "Moment captured.")
+        delay = _token_budget_resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with _request_limiter:
+            raw = await client.chat.completions.with_raw_response.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    _system_message(theme),
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": orjson.dumps(user_payload).decode()},
+                            {"type": "image_url", "image_url": {"url": image_data_url or image_url}},
+                        ],
+                    },
+                ],
+                temperature=0.6,
+                top_p=0.9,
+                # <=25 words fits comfortably in 64 tokens
+                max_tokens=64,
+                response_format={"type": "json_object"},
+                extra_body=extra_body,
+            )
+        _update_token_budget(raw.headers)
+        resp = raw.parse()
+        content = resp.choices[0].message.content or ""
     except Exception as e:
-        print(f"[CaptionService Error] {e}")
-        return "Moment captured."
+        logger.error("Caption request failed: %s", e)
+        return _FALLBACK_CAPTION
+
+    try:
+        data = _validate_caption(orjson.loads(content))
+    except (orjson.JSONDecodeError, JsonSchemaException) as e:
+        logger.warning("Model returned invalid caption JSON (%s): %.120s", e, content)
+        return _FALLBACK_CAPTION
+    return data["caption"]
 
 
 async def fetch_event_media_mapping(event_id: int) -> List[Dict]:
@@ -84,7 +205,11 @@ async def fetch_event_media_mapping(event_id: int) -> List[Dict]:
         RuntimeError: If database query fails
     """
     try:
-        response = supabase.rpc("get_event_media_mapping", {"event_id_input": event_id}).execute()
+        # supabase-py's sync client blocks; run it in a worker thread so the
+        # event loop keeps serving other requests during the RPC
+        response = await asyncio.to_thread(
+            lambda: supabase.rpc("get_event_media_mapping", {"event_id_input": event_id}).execute()
+        )
         
         if not response.data:
             raise ValueError(f"Event {event_id} not found or no media available")
@@ -97,23 +222,81 @@ async def fetch_event_media_mapping(event_id: int) -> List[Dict]:
         raise RuntimeError(f"Failed to fetch media mapping for event {event_id}: {str(e)}")
 
 
+def _downscale_jpeg(data: bytes, content_type: str) -> bytes:
+    """Re-encode an image as a JPEG within _INLINE_IMAGE_MAX_SIDE (small JPEGs pass through)."""
+    size = (_INLINE_IMAGE_MAX_SIDE, _INLINE_IMAGE_MAX_SIDE)
+    with Image.open(io.BytesIO(data)) as img:
+        if content_type == "image/jpeg" and max(img.size) <= _INLINE_IMAGE_MAX_SIDE:
+            return data
+        # JPEGs decode straight at a reduced scale
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=85)
+        return out.getvalue()
+
+
+async def _fetch_image_data_url(http: httpx.AsyncClient, image_url: str) -> Optional[str]:
+    """
+    Download an image once and return it as a downscaled base64 JPEG data: URI.
+
+    None (so Azure fetches image_url itself) when the download fails or the
+    content type isn't one worth inlining.
+    """
+    async with _image_fetch_slots:
+        try:
+            r = await http.get(image_url)
+            r.raise_for_status()
+        except Exception as e:
+            logger.warning("Could not prefetch %s, letting Azure fetch it: %s", image_url, e)
+            return None
+        content_type = r.headers.get("content-type", "image/jpeg").split(";")[0].strip().lower()
+        if content_type not in _INLINE_IMAGE_TYPES:
+            return None
+        try:
+            data = await asyncio.to_thread(_downscale_jpeg, r.content, content_type)
+        except Exception as e:
+            logger.warning("Could not decode %s, letting Azure fetch it: %s", image_url, e)
+            return None
+    b64 = base64.b64encode(data).decode()
+    return f"data:image/jpeg;base64,{b64}"
+
+
+def _media_group_key(media: Dict) -> Tuple:
+    """Key identifying media that would produce the same caption prompt."""
+    tagged_users = [u["username"] for u in (media.get("tagged_users") or [])]
+    location = media.get("location", "unknown location")
+    return (media["file_url"], tuple(sorted(tagged_users)), location)
+
+
 async def generate_event_captions_batch(
     event_id: int,
     theme: str = "playful",
-    update_database: bool = True
+    update_database: bool = True,
+    force: bool = False
 ) -> List[Dict[str, str]]:
     """
     Generate captions for all media in an event using tagged users and metadata.
     Returns a list suitable for slideshow generation.
     
+    Media sharing the same image, tagged users and location are captioned once
+    and the caption is reused for every media_id in that group. Media that
+    already have an ai_caption (returned by get_event_media_mapping) keep it
+    unless force=True.
+    
     Args:
         event_id: The event ID to generate captions for
         theme: Theme prompt for caption generation (e.g., "playful", "nostalgic", "adventurous")
         update_database: Whether to update the ai_caption field in Supabase (default: True)
+        force: Regenerate captions even for media that already have one (default: False)
     
     Returns:
-        List of dicts with 'image_url' and 'caption' keys, suitable for create_slideshow()
-        Example: [{"image_url": "https://...", "caption": "Beautiful moment with friends"}]
+        List of dicts with 'image_url', 'caption', 'media_id', 'tagged_users' and
+        'generated' (False when an existing caption was kept) keys, in event
+        media order, suitable for create_slideshow()
+        Example: [{"image_url": "https://...", "caption": "Beautiful moment with friends", "media_id": 1,
+                   "tagged_users": ["alice"], "generated": True}]
     
     Raises:
         ValueError: If event not found or no media available
@@ -123,41 +306,85 @@ async def generate_event_captions_batch(
         # Fetch all media + tagged users
         media_items = await fetch_event_media_mapping(event_id)
         
-        print(f"[CaptionService] Generating captions for {len(media_items)} media items from event {event_id}")
+        # Group identical (image, people, location) items so each unique
+        # combination costs exactly one LLM call
+        groups: Dict[Tuple, List[Dict]] = defaultdict(list)
+        reused = 0
+        for media in media_items:
+            if not force and media.get("ai_caption"):
+                reused += 1
+                continue
+            groups[_media_group_key(media)].append(media)
         
-        captions_for_slideshow = []
+        logger.info("Generating captions for %d media items (%d unique, %d already captioned) from event %s",
+                    len(media_items), len(groups), reused, event_id)
         
-        for media in media_items:
-            tagged_users = [u["username"] for u in (media.get("tagged_users") or [])]
-            file_url = media["file_url"]
-            location = media.get("location", "unknown location")
-            media_id = media["media_id"]
-            
+        # Each image is downloaded once per batch and inlined as a data URI;
+        # in-flight downloads are shared by groups that use the same image and
+        # dropped once the last of those groups has it
+        image_fetches: Dict[str, asyncio.Task] = {}
+        groups_left = Counter(file_url for file_url, _, _ in groups)
+        
+        http = _get_http_client()
+        
+        async def _caption_group(key: Tuple) -> str:
+            file_url, tagged_users, location = key
+            if file_url not in image_fetches:
+                image_fetches[file_url] = asyncio.create_task(_fetch_image_data_url(http, file_url))
+            image_data_url = await image_fetches[file_url]
+            groups_left[file_url] -= 1
+            if not groups_left[file_url]:
+                del image_fetches[file_url]
             # Generate caption using Azure OpenAI
-            caption = await generate_caption(
+            return await generate_caption(
                 image_url=file_url,
-                tagged_names=tagged_users,
+                tagged_names=list(tagged_users),
                 location=location,
-                theme=theme
+                theme=theme,
+                event_id=event_id,
+                image_data_url=image_data_url
             )
+        
+        keys = list(groups.keys())
+        group_captions = await asyncio.gather(*[_caption_group(k) for k in keys])
+        caption_by_key = dict(zip(keys, group_captions))
+        
+        async def _save_group(media_ids: List[int], caption: str) -> None:
+            try:
+                await asyncio.to_thread(
+                    lambda: supabase.table("media").update({"ai_caption": caption}).in_("media_id", media_ids).execute()
+                )
+            except Exception as e:
+                logger.warning("Failed to update caption in database for media %s: %s", media_ids, e)
+                # Continue even if database update fails
+        
+        writes = []
+        for key, caption in caption_by_key.items():
+            media_ids = [m["media_id"] for m in groups[key]]
+            logger.info("Generated caption for media %s: %.50s...", media_ids, caption)
             
-            print(f"[CaptionService] Generated caption for media {media_id}: {caption[:50]}...")
-            
-            # Update caption in Supabase if requested
+            # Update caption in Supabase if requested (one write per unique group)
             if update_database:
-                try:
-                    supabase.table("media").update({"ai_caption": caption}).eq("media_id", media_id).execute()
-                except Exception as e:
-                    print(f"[CaptionService] WARNING: Failed to update caption in database for media {media_id}: {str(e)}")
-                    # Continue even if database update fails
-            
-            # Add to slideshow-ready format
+                writes.append(_save_group(media_ids, caption))
+        await asyncio.gather(*writes)
+        
+        # Fan captions back out in the original media order (slideshow-ready format)
+        captions_for_slideshow = []
+        for media in media_items:
+            generated = force or not media.get("ai_caption")
+            if generated:
+                caption = caption_by_key[_media_group_key(media)]
+            else:
+                caption = media["ai_caption"]
             captions_for_slideshow.append({
-                "image_url": file_url,
-                "caption": caption
+                "image_url": media["file_url"],
+                "caption": caption,
+                "media_id": media["media_id"],
+                "tagged_users": [u["username"] for u in (media.get("tagged_users") or [])],
+                "generated": generated
             })
         
-        print(f"[CaptionService] Successfully generated {len(captions_for_slideshow)} captions for event {event_id}")
+        logger.info("Successfully generated %d captions for event %s", len(captions_for_slideshow), event_id)
         
         return captions_for_slideshow
     
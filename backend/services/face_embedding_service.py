@@ -10,20 +10,28 @@ Storage options:
         - user_id: integer (FK → users.id)
         - embedding: jsonb (array of floats)
         - created_at: timestamptz default now()
-- Otherwise, embeddings are stored in backend/data/embeddings.json as a simple list.
+- Otherwise, embeddings are appended to backend/data/embeddings.f16.bin (raw float16,
+    512 values per row) with the matching user ids in backend/data/embeddings_uids.i32.bin
+    (raw int32). Older embeddings.json / embeddings.npy stores are migrated on first read.
 
 This keeps the app runnable even without Azure PersonGroup recognition access.
 """
 
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import io
-import json
 import math
 import os
+import threading
+import time
 from pathlib import Path
 
 import httpx
+import orjson
 
 # Lazy imports for heavy deps so the app can start without them
 _lazy_deps_loaded = False
@@ -34,6 +42,31 @@ _MTCNN = None
 _InceptionResnetV1 = None
 _HEIF_AVAILABLE = False
 FACE_DEBUG = os.getenv("FACE_DEBUG", "").lower() in ("1", "true", "yes")
+# Images are thumbnailed to this max side before MTCNN; faces stay well above its 20px minimum
+FACE_DETECT_MAX_DIM = 1600
+# FACE_WARMUP=0 skips loading/warming the face models at app startup
+FACE_WARMUP = os.getenv("FACE_WARMUP", "1").lower() in ("1", "true", "yes")
+FACE_CUDNN_BENCHMARK = os.getenv("FACE_CUDNN_BENCHMARK", "1").lower() in ("1", "true", "yes")
+# Set FACE_TORCH_COMPILE=0 to skip torch.compile (e.g. to avoid the startup compile cost)
+FACE_TORCH_COMPILE = os.getenv("FACE_TORCH_COMPILE", "1").lower() in ("1", "true", "yes")
+# CUDA always runs the resnet in fp16; bf16 autocast on CPU is opt-in since
+# older CPUs without AVX512-BF16/AMX emulate it and run slower than fp32.
+FACE_CPU_BF16 = os.getenv("FACE_CPU_BF16", "").lower() in ("1", "true", "yes")
+# Optional ONNX export of the resnet (scripts/export_face_onnx.py); used instead of
+# PyTorch when the file exists and onnxruntime is installed.
+FACE_ONNX_PATH = Path(
+    os.getenv("FACE_ONNX_PATH", str(Path(__file__).resolve().parent.parent / "data" / "face_resnet.onnx"))
+)
+# FACE_TRT_INT8=1 additionally lets TensorRT run the resnet in INT8. Needs a calibration
+# table (FACE_TRT_CALIB_TABLE, generated from sample face crops with onnxruntime's
+# calibration tools) in the same directory as the model; FP16 is used otherwise.
+FACE_TRT_INT8 = os.getenv("FACE_TRT_INT8", "").lower() in ("1", "true", "yes")
+FACE_TRT_CALIB_TABLE = os.getenv("FACE_TRT_CALIB_TABLE", "face_resnet_calibration.flatbuffers")
+# FACE_ONNX_MTCNN=1 runs the MTCNN P/R/O-nets from pnet.onnx, rnet.onnx and onet.onnx in
+# FACE_MTCNN_ONNX_DIR (scripts/export_mtcnn_onnx.py). facenet-pytorch still runs the
+# cascade (image pyramid, NMS, box calibration); only the network forwards move to ORT.
+FACE_ONNX_MTCNN = os.getenv("FACE_ONNX_MTCNN", "").lower() in ("1", "true", "yes")
+FACE_MTCNN_ONNX_DIR = Path(os.getenv("FACE_MTCNN_ONNX_DIR", str(FACE_ONNX_PATH.parent)))
 
 
 def _load_deps():
@@ -54,6 +87,10 @@ def _load_deps():
     _Image = _Image_mod
     _MTCNN = _MTCNN_mod
     _InceptionResnetV1 = _IR_mod
+    if FACE_CUDNN_BENCHMARK:
+        # Let cuDNN pick the fastest conv algorithms per input shape; the resnet input is
+        # always 160x160 and MTCNN inputs are capped at FACE_DETECT_MAX_DIM.
+        _torch.backends.cudnn.benchmark = True
     # Register HEIC/HEIF opener if pillow-heif is available, so PIL.Image.open works for HEIC
     global _HEIF_AVAILABLE
     try:
@@ -65,6 +102,30 @@ def _load_deps():
     _lazy_deps_loaded = True
 
 
+_EXIF_ORIENTATION = 0x0112
+
+
+def _decode_heif(image_bytes: bytes):
+    """Decode HEIC/HEIF bytes into an RGB PIL image.
+
+    libheif applies the container's rotation/mirroring on decode, so no EXIF transpose is
+    needed; that is the only saving over the generic path. The pixels are still copied once:
+    frombuffer only shares memory for modes like RGBA/L, not RGB, and MTCNN needs 3 channels.
+    """
+    import pillow_heif  # type: ignore
+    heif_file = pillow_heif.read_heif(image_bytes)
+    img = _Image.frombuffer(
+        heif_file.mode,
+        heif_file.size,
+        heif_file.data,
+        "raw",
+        heif_file.mode,
+        heif_file.stride,
+        1,
+    )
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
 def _open_image_bytes_rgb(image_bytes: bytes):
     """Open image bytes into a PIL RGB image with HEIC/HEIF fallback if available."""
     _load_deps()
@@ -73,56 +134,26 @@ def _open_image_bytes_rgb(image_bytes: bytes):
     looks_heif = any(sig in header for sig in (b"ftypheic", b"ftypheif", b"ftypheix", b"ftypmif1", b"ftypmsf1"))
     if _HEIF_AVAILABLE and looks_heif:
         try:
-            import pillow_heif  # type: ignore
-            heif_file = pillow_heif.read_heif(image_bytes)
-            from PIL import Image as _PILImage  # type: ignore
-            img = _PILImage.frombytes(
-                heif_file.mode,
-                heif_file.size,
-                heif_file.data,
-                "raw",
-                heif_file.mode,
-                heif_file.stride,
-            )
-            try:
-                # Apply EXIF orientation if present
-                from PIL import ImageOps as _ImageOps  # type: ignore
-                img = _ImageOps.exif_transpose(img)
-            except Exception:
-                pass
-            return img.convert("RGB")
+            return _decode_heif(image_bytes)
         except Exception as inner:
             # Fall back to PIL open if HEIF decode unexpectedly fails
             print(f"[WARN] HEIF sniff matched but decode failed: {inner}")
     try:
         img = _Image.open(io.BytesIO(image_bytes))
+        img.load()
+        # Most photos are already upright; only pay for a transposed copy when they aren't
         try:
-            from PIL import ImageOps as _ImageOps  # type: ignore
-            img = _ImageOps.exif_transpose(img)
+            if img.getexif().get(_EXIF_ORIENTATION, 1) != 1:
+                from PIL import ImageOps as _ImageOps  # type: ignore
+                img = _ImageOps.exif_transpose(img)
         except Exception:
             pass
-        return img.convert("RGB")
+        return img if img.mode == "RGB" else img.convert("RGB")
     except Exception as e:
         # Try pillow-heif manual decode if registered opener didn't handle it
         if _HEIF_AVAILABLE:
             try:
-                import pillow_heif  # type: ignore
-                heif_file = pillow_heif.read_heif(image_bytes)
-                from PIL import Image as _PILImage  # type: ignore
-                img = _PILImage.frombytes(
-                    heif_file.mode,
-                    heif_file.size,
-                    heif_file.data,
-                    "raw",
-                    heif_file.mode,
-                    heif_file.stride,
-                )
-                try:
-                    from PIL import ImageOps as _ImageOps  # type: ignore
-                    img = _ImageOps.exif_transpose(img)
-                except Exception:
-                    pass
-                return img.convert("RGB")
+                return _decode_heif(image_bytes)
             except Exception as inner:
                 raise RuntimeError(
                     f"Unsupported or corrupted image format (HEIF decode failed: {inner})"
@@ -131,6 +162,89 @@ def _open_image_bytes_rgb(image_bytes: bytes):
         raise RuntimeError(f"Unsupported or corrupted image format: {str(e)}") from e
 
 
+# Recent image -> embedding results keyed by a content hash, so re-submitting the
+# same upload (retries, reloads) skips detection and the resnet forward entirely.
+FACE_EMB_CACHE_SIZE = int(os.getenv("FACE_EMB_CACHE_SIZE", "256"))
+_emb_lru: "OrderedDict[Tuple[str, bytes], Any]" = OrderedDict()
+# Read and written from embedding-pool worker threads
+_emb_lru_lock = threading.Lock()
+
+
+def _content_key(image_bytes: bytes) -> bytes:
+    return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+
+def _cache_get(key: Tuple[str, bytes]) -> Tuple[bool, Any]:
+    with _emb_lru_lock:
+        try:
+            value = _emb_lru[key]
+        except KeyError:
+            return False, None
+        _emb_lru.move_to_end(key)
+        return True, value
+
+
+def _cache_put(key: Tuple[str, bytes], value: Any) -> None:
+    if FACE_EMB_CACHE_SIZE <= 0:
+        return
+    with _emb_lru_lock:
+        _emb_lru[key] = value
+        _emb_lru.move_to_end(key)
+        while len(_emb_lru) > FACE_EMB_CACHE_SIZE:
+            _emb_lru.popitem(last=False)
+
+
+def _ort_session(path: Path, device_type: str, tensorrt: bool = False, int8: bool = False):
+    """ONNX Runtime session for path on the best available execution provider, or None."""
+    if not path.exists():
+        return None
+    try:
+        import onnxruntime as ort  # type: ignore
+    except Exception:
+        return None
+    available = ort.get_available_providers()
+    providers: List[Any] = []
+    if device_type == "cuda":
+        if tensorrt and "TensorrtExecutionProvider" in available:
+            trt_options = {
+                "trt_fp16_enable": True,
+                "trt_engine_cache_enable": True,
+                "trt_engine_cache_path": str(path.parent),
+            }
+            if int8:
+                if (path.parent / FACE_TRT_CALIB_TABLE).exists():
+                    # FP16 stays enabled for layers TensorRT can't run in INT8
+                    trt_options["trt_int8_enable"] = True
+                    trt_options["trt_int8_calibration_table_name"] = FACE_TRT_CALIB_TABLE
+                else:
+                    print(f"[WARN] FACE_TRT_INT8 is set but {FACE_TRT_CALIB_TABLE} is missing; using FP16")
+            providers.append(("TensorrtExecutionProvider", trt_options))
+        if "CUDAExecutionProvider" in available:
+            providers.append("CUDAExecutionProvider")
+    providers.append("CPUExecutionProvider")
+    try:
+        return ort.InferenceSession(str(path), providers=providers)
+    except Exception as e:
+        print(f"[WARN] Failed to load ONNX model {path}, using PyTorch: {e}")
+        return None
+
+
+def _ort_module(session):
+    """torch.nn.Module running an MTCNN stage network through an ORT session.
+
+    facenet-pytorch calls pnet/rnet/onet with a float tensor and indexes the returned
+    tuple, so outputs are handed back as tensors on the input's device.
+    """
+    input_name = session.get_inputs()[0].name
+
+    class OrtNet(_torch.nn.Module):
+        def forward(self, x):
+            outputs = session.run(None, {input_name: x.detach().float().cpu().numpy()})
+            return tuple(_torch.from_numpy(o).to(x.device) for o in outputs)
+
+    return OrtNet()
+
+
 class FaceEmbedder:
     def __init__(self, device: Optional[str] = None) -> None:
         _load_deps()
@@ -139,211 +253,906 @@ class FaceEmbedder:
         self.device = device
         self.mtcnn = _MTCNN(keep_all=True, device=self.device)
         self.model = _InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        # Inference only: frozen weights mean no autograd bookkeeping even outside inference_mode
+        self.model.requires_grad_(False)
+        self.mtcnn.requires_grad_(False)
+        self.device_type = "cuda" if str(self.device).startswith("cuda") else "cpu"
+        # On CUDA the weights themselves are fp16 (half the memory/bandwidth, tensor cores);
+        # inputs are cast to match and outputs back to float32 for stable norms.
+        self._model_dtype = None
+        self._amp_dtype = None
+        if self.device_type == "cuda":
+            self.model = self.model.half()
+            self._model_dtype = _torch.float16
+        elif FACE_CPU_BF16:
+            self._amp_dtype = _torch.bfloat16
+        # Page-locked host buffer for device->host copies of embeddings (CUDA only); grown on demand
+        self._pinned = None
+        self._pinned_lock = threading.Lock()
+        # MTCNN runs on its own persistent stream. This only isolates it from the default
+        # stream: within a request detection and embedding are sequential, and detect()
+        # syncs to return host arrays, so nothing overlaps unless FACE_EMBED_WORKERS > 1
+        # has another thread queueing resnet work at the same time
+        self._detect_stream = _torch.cuda.Stream(device=self.device) if self.device_type == "cuda" else None
+        self._ort = self._load_onnx_session()
+        if FACE_ONNX_MTCNN:
+            self._load_onnx_mtcnn()
+        if self._ort is None and FACE_TORCH_COMPILE and hasattr(_torch, "compile"):
+            self._compile_model()
 
-    def embed_image(self, image_bytes: bytes) -> Optional[List[float]]:
-        """Return a 512-D embedding for the largest detected face, or None if no face."""
-        img = _open_image_bytes_rgb(image_bytes)
-        boxes, probs = self.mtcnn.detect(img)
-        if (boxes is None or len(boxes) == 0) and max(img.size) > 2000:
-            # Downscale very large images to improve MTCNN detection reliability
-            scale = 1600.0 / float(max(img.size))
-            new_wh = (max(1, int(img.size[0] * scale)), max(1, int(img.size[1] * scale)))
-            if FACE_DEBUG:
-                print(f"[FACE_DEBUG] embed_image: initial detect failed on {img.size}, retrying at {new_wh}")
-            img_small = img.resize(new_wh)
-            boxes, probs = self.mtcnn.detect(img_small)
-            if boxes is not None and len(boxes) > 0:
-                img = img_small
-        if (boxes is None or len(boxes) == 0):
+    def _load_onnx_session(self):
+        """ONNX Runtime session for the exported resnet, or None to stay on PyTorch."""
+        session = _ort_session(FACE_ONNX_PATH, self.device_type, tensorrt=True, int8=FACE_TRT_INT8)
+        if session is not None and FACE_DEBUG:
+            print(f"[FACE_DEBUG] ONNX face model loaded with {session.get_providers()}")
+        return session
+
+    def _load_onnx_mtcnn(self) -> None:
+        """Swap the MTCNN stage networks for ONNX Runtime sessions when all three exports load."""
+        sessions = [_ort_session(FACE_MTCNN_ONNX_DIR / f"{name}.onnx", self.device_type) for name in ("pnet", "rnet", "onet")]
+        if any(sess is None for sess in sessions):
+            print(f"[WARN] FACE_ONNX_MTCNN is set but MTCNN ONNX models in {FACE_MTCNN_ONNX_DIR} did not load; using PyTorch")
+            return
+        self.mtcnn.pnet, self.mtcnn.rnet, self.mtcnn.onet = (_ort_module(sess) for sess in sessions)
+        if FACE_DEBUG:
+            print(f"[FACE_DEBUG] ONNX MTCNN loaded with {sessions[0].get_providers()}")
+
+    def _compile_model(self) -> None:
+        """Compile the resnet forward and run one warmup pass so requests don't pay for it."""
+        eager = self.model
+        # reduce-overhead captures CUDA graphs for the fixed 160x160 input; it buys
+        # nothing on CPU, where the default mode's op fusion is what helps.
+        mode = "reduce-overhead" if self.device_type == "cuda" else "default"
+        try:
+            self.model = _torch.compile(eager, mode=mode, fullgraph=False)
+            self._forward(_torch.zeros(1, 3, 160, 160, device=self.device))
+        except Exception as e:
+            print(f"[WARN] torch.compile unavailable for face model, using eager: {e}")
+            self.model = eager
+
+    def _detect(self, img):
+        """mtcnn.detect under inference mode, on the detection stream when on CUDA."""
+        with _torch.inference_mode():
+            if self._detect_stream is None:
+                return self.mtcnn.detect(img)
+            with _torch.cuda.stream(self._detect_stream):
+                # detect() returns host numpy arrays, so results are complete on return
+                return self.mtcnn.detect(img)
+
+    def _detect_grouped(self, imgs: List[Any]) -> List[Tuple[Any, Any]]:
+        """(boxes, probs) per image; MTCNN only batches equal-sized images, so group by size."""
+        out: List[Tuple[Any, Any]] = [(None, None)] * len(imgs)
+        by_size: Dict[Tuple[int, int], List[int]] = {}
+        for i, img in enumerate(imgs):
+            by_size.setdefault(img.size, []).append(i)
+        for idxs in by_size.values():
+            if len(idxs) == 1:
+                out[idxs[0]] = self._detect(imgs[idxs[0]])
+                continue
+            batch_boxes, batch_probs = self._detect([imgs[i] for i in idxs])
+            for i, boxes, probs in zip(idxs, batch_boxes, batch_probs):
+                out[i] = (boxes, probs)
+        return out
+
+    def _detect_batch(self, imgs: List[Any], tag: str) -> List[Tuple[Any, Any, Any, float]]:
+        """Run MTCNN over many images, then a contrast-boost pass for any without a face.
+
+        Images larger than FACE_DETECT_MAX_DIM are thumbnailed in place first, since
+        MTCNN cost grows with pixel count. Returns (img, boxes, probs, scale) per
+        image; boxes refer to img, multiply by scale for original-image coordinates.
+        Both passes detect all their images in batched MTCNN calls.
+        """
+        scales: List[float] = []
+        for img in imgs:
+            orig_w = img.size[0]
+            if max(img.size) > FACE_DETECT_MAX_DIM:
+                if FACE_DEBUG:
+                    print(f"[FACE_DEBUG] {tag}: downscaling {img.size} to max {FACE_DETECT_MAX_DIM} before detect")
+                img.thumbnail((FACE_DETECT_MAX_DIM, FACE_DETECT_MAX_DIM), _Image.BILINEAR)
+            scales.append(orig_w / float(img.size[0]))
+        detected = [(img, boxes, probs) for img, (boxes, probs) in zip(imgs, self._detect_grouped(imgs))]
+        missed = [i for i, (_img, boxes, _probs) in enumerate(detected) if boxes is None or len(boxes) == 0]
+        if missed:
             # Contrast boost fallback for low-light / low-contrast images
             try:
                 from PIL import ImageEnhance as _ImageEnhance  # type: ignore
-                enhancer = _ImageEnhance.Contrast(img)
-                img_boost = enhancer.enhance(1.6)
-                boxes, probs = self.mtcnn.detect(img_boost)
-                if boxes is not None and len(boxes) > 0:
-                    img = img_boost
-                    if FACE_DEBUG:
-                        print("[FACE_DEBUG] embed_image: contrast boost succeeded")
+                boosted = [_ImageEnhance.Contrast(imgs[i]).enhance(1.6) for i in missed]
+                for i, img_boost, (boxes, probs) in zip(missed, boosted, self._detect_grouped(boosted)):
+                    if boxes is not None and len(boxes) > 0:
+                        if FACE_DEBUG:
+                            print(f"[FACE_DEBUG] {tag}: contrast boost succeeded")
+                        detected[i] = (img_boost, boxes, probs)
             except Exception:
                 pass
         if FACE_DEBUG:
-            try:
-                print(f"[FACE_DEBUG] embed_image: boxes={0 if boxes is None else len(boxes)}, probs={[] if probs is None else [round(float(p),4) for p in probs]}")
-            except Exception:
-                pass
-        if boxes is None or len(boxes) == 0:
-            return None
-        # Pick largest box
-        areas = [max(0.0, float((x2 - x1) * (y2 - y1))) for (x1, y1, x2, y2) in boxes]
-        idx = int(max(range(len(areas)), key=lambda i: areas[i]))
-        # Extract aligned face from the chosen box to guarantee index alignment
-        faces = self.mtcnn.extract(img, boxes, save_path=None)
-        if faces is None or faces.shape[0] == 0:
-            return None
-        face_tensor = faces[idx].unsqueeze(0).to(self.device)
-        with _torch.no_grad():
-            emb = self.model(face_tensor).cpu().numpy()[0]
-        # Normalize to unit length
-        norm = float(_np.linalg.norm(emb))
-        if norm == 0.0:
-            return emb.astype(float).tolist()
-        return (emb / norm).astype(float).tolist()
+            for _img, boxes, probs in detected:
+                try:
+                    print(f"[FACE_DEBUG] {tag}: boxes={0 if boxes is None else len(boxes)}, probs={[] if probs is None else [round(float(p),4) for p in probs]}")
+                except Exception:
+                    pass
+        return [(img, boxes, probs, scale) for (img, boxes, probs), scale in zip(detected, scales)]
+
+    def _forward(self, faces):
+        """Resnet forward under inference mode (fp16 on CUDA, bf16 autocast if enabled); returns float32."""
+        if self._ort is not None:
+            inp = faces.detach().cpu().numpy().astype(_np.float32, copy=False)
+            out = self._ort.run(None, {self._ort.get_inputs()[0].name: inp})[0]
+            return _torch.from_numpy(out)
+        with _torch.inference_mode():
+            if self._model_dtype is not None:
+                return self.model(faces.to(dtype=self._model_dtype)).float()
+            if self._amp_dtype is None:
+                return self.model(faces)
+            with _torch.autocast(device_type=self.device_type, dtype=self._amp_dtype):
+                return self.model(faces).float()
+
+    def _to_host(self, out) -> Any:
+        """Copy a CUDA (F,512) result through the pinned buffer; returns a numpy copy."""
+        n = out.shape[0]
+        with self._pinned_lock:
+            if self._pinned is None or self._pinned.shape[0] < n:
+                size = max(n, 32 if self._pinned is None else 2 * self._pinned.shape[0])
+                self._pinned = _torch.empty((size, out.shape[1]), dtype=_torch.float32, pin_memory=True)
+            buf = self._pinned[:n]
+            buf.copy_(out, non_blocking=True)
+            _torch.cuda.current_stream(out.device).synchronize()
+            # The buffer is reused by the next call, so hand back an owned copy
+            return buf.numpy().copy()
+
+    def _embed_faces(self, faces) -> Any:
+        """Single resnet forward over a (F,3,160,160) face stack; returns unit-norm (F,512) rows."""
+        out = self._forward(faces.to(self.device, non_blocking=True))
+        if out.device.type == "cuda":
+            embs = self._to_host(out)
+        else:
+            embs = out.numpy()
+        norms = _np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        return (embs / norms).astype(_np.float32, copy=False)
+
+    def embed_image(self, image_bytes: bytes) -> Optional[_np.ndarray]:
+        """Return a unit-norm float32 (512,) embedding for the largest detected face, or None if no face."""
+        return self.embed_images_batch([image_bytes])[0]
+
+    def embed_images_batch(self, images: List[bytes]) -> List[Optional[_np.ndarray]]:
+        """Embed the largest face of each image with one batched resnet forward.
+
+        Returns one entry per input, None where no face was detected. Images seen
+        recently (by content hash) are served from the embedding cache.
+        """
+        keys = [("largest", _content_key(b)) for b in images]
+        results: List[Optional[_np.ndarray]] = [None] * len(images)
+        misses: List[int] = []
+        for i, key in enumerate(keys):
+            hit, value = _cache_get(key)
+            if hit:
+                results[i] = value
+            else:
+                misses.append(i)
+        if misses:
+            fresh = self._embed_images_uncached([images[i] for i in misses])
+            for i, emb in zip(misses, fresh):
+                _cache_put(keys[i], emb)
+                results[i] = emb
+        return results
+
+    def _embed_images_uncached(self, images: List[bytes]) -> List[Optional[_np.ndarray]]:
+        imgs = [_open_image_bytes_rgb(b) for b in images]
+        results: List[Optional[_np.ndarray]] = [None] * len(imgs)
+        face_tensors = []
+        owners: List[int] = []
+        for i, (img, boxes, _probs, _scale) in enumerate(self._detect_batch(imgs, "embed_image")):
+            if boxes is None or len(boxes) == 0:
+                continue
+            # Pick largest box
+            b = _np.asarray(boxes)
+            areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+            idx = int(_np.argmax(_np.maximum(areas, 0.0)))
+            # Align/crop only the chosen face; extract() also applies MTCNN's standardization,
+            # which a bare extract_face() call would skip
+            face = self.mtcnn.extract(img, b[idx:idx + 1], save_path=None)
+            if face is None or face.shape[0] == 0:
+                continue
+            face_tensors.append(face)
+            owners.append(i)
+        if not face_tensors:
+            return results
+        embs = self._embed_faces(_torch.cat(face_tensors, 0))
+        for i, emb in zip(owners, embs):
+            results[i] = emb
+        return results
 
     def embed_all_faces(self, image_bytes: bytes) -> List[Dict[str, Any]]:
         """
         Return embeddings for all detected faces with their boxes and probs.
-        Output: [{"box": [x1,y1,x2,y2], "prob": float, "embedding": [512 floats]}]
+        Output: [{"box": [x1,y1,x2,y2], "prob": float, "embedding": float32 ndarray (512,)}]
         """
+        key = ("all", _content_key(image_bytes))
+        hit, cached = _cache_get(key)
+        if not hit:
+            cached = self._embed_all_faces_uncached(image_bytes)
+            _cache_put(key, cached)
+        # Callers may filter/annotate the face dicts; don't let that leak into the cache
+        return [dict(f) for f in cached]
+
+    def _embed_all_faces_uncached(self, image_bytes: bytes) -> List[Dict[str, Any]]:
         img = _open_image_bytes_rgb(image_bytes)
-        boxes, probs = self.mtcnn.detect(img)
-        if (boxes is None or len(boxes) == 0) and max(img.size) > 2000:
-            scale = 1600.0 / float(max(img.size))
-            new_wh = (max(1, int(img.size[0] * scale)), max(1, int(img.size[1] * scale)))
-            if FACE_DEBUG:
-                print(f"[FACE_DEBUG] embed_all_faces: initial detect failed on {img.size}, retrying at {new_wh}")
-            img_small = img.resize(new_wh)
-            boxes, probs = self.mtcnn.detect(img_small)
-            if boxes is not None and len(boxes) > 0:
-                img = img_small
-        if (boxes is None or len(boxes) == 0):
-            # Contrast boost fallback
-            try:
-                from PIL import ImageEnhance as _ImageEnhance  # type: ignore
-                enhancer = _ImageEnhance.Contrast(img)
-                img_boost = enhancer.enhance(1.6)
-                boxes, probs = self.mtcnn.detect(img_boost)
-                if boxes is not None and len(boxes) > 0:
-                    img = img_boost
-                    if FACE_DEBUG:
-                        print("[FACE_DEBUG] embed_all_faces: contrast boost succeeded")
-            except Exception:
-                pass
-        if FACE_DEBUG:
-            try:
-                print(f"[FACE_DEBUG] embed_all_faces: boxes={0 if boxes is None else len(boxes)}, probs={[] if probs is None else [round(float(p),4) for p in probs]}")
-            except Exception:
-                pass
+        img, boxes, probs, scale = self._detect_batch([img], "embed_all_faces")[0]
         if boxes is None or len(boxes) == 0:
             return []
         # Extract aligned faces using the same detected boxes to keep order consistent
         faces = self.mtcnn.extract(img, boxes, save_path=None)
         if faces is None or faces.shape[0] == 0:
             return []
-        faces = faces.to(self.device)
-        with _torch.no_grad():
-            embs = self.model(faces).cpu().numpy()
-        # Normalize each
+        vecs = self._embed_faces(faces)
+        # Boxes/probs go into API responses; convert them to Python floats in one pass
+        box_list = (_np.asarray(boxes, dtype=_np.float64) * scale).tolist()
+        prob_list = [] if probs is None else _np.asarray(probs, dtype=_np.float64).tolist()
         results: List[Dict[str, Any]] = []
-        for i in range(embs.shape[0]):
-            vec = embs[i]
-            norm = float(_np.linalg.norm(vec))
-            if norm != 0.0:
-                vec = (vec / norm)
-            b = boxes[i]
-            p = probs[i] if probs is not None and i < len(probs) else None
-            x1, y1, x2, y2 = [float(v) for v in b]
+        for i, vec in enumerate(vecs):
+            p = prob_list[i] if i < len(prob_list) else None
             results.append({
-                "box": [x1, y1, x2, y2],
-                "prob": float(p) if p is not None else None,
-                "embedding": vec.astype(float).tolist(),
+                "box": box_list[i],
+                "prob": p,
+                "embedding": vec,
             })
         return results
 
 
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    _load_deps()
-    va = _np.asarray(a, dtype=_np.float32)
-    vb = _np.asarray(b, dtype=_np.float32)
-    denom = (float(_np.linalg.norm(va)) * float(_np.linalg.norm(vb)))
-    if denom == 0.0:
-        return 0.0
-    return float(va.dot(vb) / denom)
+
+# One embedder per process: MTCNN + InceptionResnetV1 weights are loaded once
+_EMBEDDER: Optional[FaceEmbedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> FaceEmbedder:
+    """Return the shared FaceEmbedder, creating it on first use."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        with _embedder_lock:
+            if _EMBEDDER is None:
+                _EMBEDDER = FaceEmbedder()
+    return _EMBEDDER
+
+
+# Decode + MTCNN + resnet run on this pool so model calls never block the event loop.
+# The default single worker also serializes GPU use; raise it for CPU-only hosts.
+FACE_EMBED_WORKERS = int(os.getenv("FACE_EMBED_WORKERS", "1"))
+_embed_pool = ThreadPoolExecutor(max_workers=max(1, FACE_EMBED_WORKERS), thread_name_prefix="face-embed")
+
+
+async def _run_embedder(fn, *args):
+    """Run fn(embedder, *args) on the embedding pool (loading the model there on first use)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_embed_pool, lambda: fn(get_embedder(), *args))
+
+
+def _warmup_sync(embedder: FaceEmbedder) -> None:
+    # One dummy pass through MTCNN and the resnet pays for CUDA context setup, cuDNN
+    # algorithm search and kernel autotuning before real traffic arrives.
+    embedder._detect(_Image.new("RGB", (160, 160)))
+    embedder._forward(_torch.zeros(1, 3, 160, 160, device=embedder.device))
+
+
+async def warmup() -> None:
+    """Load the shared embedder and run it once; called from the app lifespan."""
+    if not FACE_WARMUP:
+        return
+    try:
+        await _run_embedder(_warmup_sync)
+    except Exception as e:
+        # Local face features are optional; the app still serves everything else
+        print(f"[WARN] Face model warmup skipped: {e}")
 
 
 # Storage helpers
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-LOCAL_EMB_PATH = Path(__file__).resolve().parent.parent / "data" / "embeddings.json"
+LOCAL_EMB_PATH = Path(__file__).resolve().parent.parent / "data" / "embeddings.json"  # legacy
+LOCAL_EMB_NPY_PATH = LOCAL_EMB_PATH.with_name("embeddings.npy")  # legacy
+LOCAL_EMB_NPY_UIDS_PATH = LOCAL_EMB_PATH.with_name("embeddings_uids.npy")  # legacy
+# Append-only shards: rows are only ever added, so saves never rewrite the file
+LOCAL_EMB_MAT_PATH = LOCAL_EMB_PATH.with_name("embeddings.f16.bin")
+LOCAL_EMB_UIDS_PATH = LOCAL_EMB_PATH.with_name("embeddings_uids.i32.bin")
+LOCAL_ANN_PATH = LOCAL_EMB_PATH.with_name("embeddings.hnsw")
 LOCAL_EMB_PATH.parent.mkdir(parents=True, exist_ok=True)
+_local_lock = threading.RLock()
+# FACE_PGVECTOR=1 also writes each embedding to a pgvector `emb` column and runs
+# identify's top-k search in Postgres (see _match_faces_remote for the schema)
+FACE_PGVECTOR = os.getenv("FACE_PGVECTOR", "").lower() in ("1", "true", "yes")
 
+# Shared Supabase REST client so requests reuse pooled (HTTP/2) connections
+# instead of paying a TLS handshake per call. Closed from the app lifespan.
+_HTTPX: Optional[httpx.AsyncClient] = None
 
-async def save_embedding(user_id: int, embedding: List[float]) -> Dict[str, Any]:
-    if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-        async with httpx.AsyncClient(timeout=20.0) as c:
-            url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/face_embeddings"
+
+def get_client() -> httpx.AsyncClient:
+    global _HTTPX
+    if _HTTPX is None or _HTTPX.is_closed:
+        headers = {}
+        if SUPABASE_SERVICE_ROLE_KEY:
             headers = {
                 "apikey": SUPABASE_SERVICE_ROLE_KEY,
                 "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                "Content-Type": "application/json",
-                "Prefer": "return=representation",
             }
-            payload = {"user_id": user_id, "embedding": embedding}
-            r = await c.post(url, json=payload, headers=headers)
-            if r.status_code < 400:
-                return {"status_code": r.status_code, "body": _safe_json(r.text)}
-            # Fallback to local on RLS/authorization or any error
-            supabase_error = {"status_code": r.status_code, "body": _safe_json(r.text)}
-            items = _read_local()
-            items.append({"user_id": user_id, "embedding": embedding})
-            _write_local(items)
-            return {"status_code": 200, "body": {"stored": "local", "supabase_error": supabase_error}}
+        # The transport owns pooling when passed explicitly; retries cover
+        # transient connect failures (reset/refused), not HTTP error statuses.
+        _HTTPX = httpx.AsyncClient(
+            timeout=20.0,
+            headers=headers,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=10),
+            ),
+        )
+    return _HTTPX
+
+
+async def close_client() -> None:
+    global _HTTPX
+    if _HTTPX is not None:
+        await _HTTPX.aclose()
+        _HTTPX = None
+
+
+async def save_embedding(user_id: int, embedding: Any) -> Dict[str, Any]:
+    """Persist one embedding (float32 ndarray or list of floats) for a user."""
+    return await save_embeddings_bulk(user_id, [embedding])
+
+
+async def save_embeddings_bulk(user_id: int, embeddings: List[Any]) -> Dict[str, Any]:
+    """Persist several embeddings for a user with a single insert / local write."""
+    if not embeddings:
+        return {"status_code": 200, "body": []}
+    loads_started, loads_overlapped = _corpus_loads_started, _corpus_loads_in_flight > 0
+    try:
+        result = await _store_embeddings(user_id, embeddings)
+    except Exception:
+        _invalidate_corpus()
+        raise
+    if loads_overlapped or _corpus_loads_started != loads_started:
+        # A corpus fetch ran alongside the insert and may already hold the new
+        # rows; appending them again would duplicate them until the next reload
+        _invalidate_corpus()
+    else:
+        _append_to_corpus(user_id, embeddings)
+    return result
+
+
+async def _store_embeddings(user_id: int, embeddings: List[Any]) -> Dict[str, Any]:
+    if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
+        c = get_client()
+        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/face_embeddings"
+        headers = {"Prefer": "return=representation"}
+        # PostgREST bulk-inserts a JSON array in one statement
+        payload = [{"user_id": user_id, "embedding": _as_list(e)} for e in embeddings]
+        if FACE_PGVECTOR:
+            for row, e in zip(payload, embeddings):
+                row["emb"] = _pgvector_literal(e)
+        r = await c.post(url, json=payload, headers=headers)
+        if r.status_code < 400:
+            return {"status_code": r.status_code, "body": r.json()}
+        # Fallback to local on RLS/authorization or any error
+        supabase_error = {"status_code": r.status_code, "body": _safe_json(r.text)}
+        _append_local(user_id, embeddings)
+        return {"status_code": 200, "body": {"stored": "local", "supabase_error": supabase_error}}
     # Local fallback
-    items = _read_local()
-    items.append({"user_id": user_id, "embedding": embedding})
-    _write_local(items)
+    _append_local(user_id, embeddings)
     return {"status_code": 200, "body": {"stored": "local"}}
 
 
-async def load_all_embeddings() -> List[Dict[str, Any]]:
+async def load_all_embeddings() -> Tuple[Any, Any]:
+    """All stored embeddings as a float32 (N, 512) matrix and the matching (N,) user ids."""
     if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-        async with httpx.AsyncClient(timeout=20.0) as c:
-            url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/face_embeddings?select=user_id,embedding,created_at"
-            headers = {
-                "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-            }
-            r = await c.get(url, headers=headers)
-            # On any Supabase error, fallback to local
-            if r.status_code >= 400:
-                local_items = _read_local()
-                return local_items
-            data = _safe_json(r.text)
-            if isinstance(data, list) and len(data) > 0:
-                return data
-            # If Supabase returns empty, try local fallback (e.g., previous local enrolls)
-            local_items = _read_local()
-            return local_items
+        c = get_client()
+        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/face_embeddings?select=user_id,embedding,created_at"
+        r = await c.get(url)
+        # On any Supabase error, fallback to local
+        if r.status_code >= 400:
+            return _read_local()
+        # orjson parses the (N x 512 floats) corpus payload several times faster than stdlib json
+        data = orjson.loads(r.content)
+        if isinstance(data, list) and len(data) > 0:
+            return _rows_to_arrays(data)
+        # If Supabase returns empty, try local fallback (e.g., previous local enrolls)
+        return _read_local()
     # No Supabase configured: use local
     return _read_local()
 
 
-def _safe_json(text: str) -> Any:
+def _pgvector_literal(embedding: Any) -> str:
+    """pgvector text input format, e.g. '[0.012345,-0.067890,...]'."""
+    return "[" + ",".join(f"{x:.6f}" for x in _as_list(embedding)) + "]"
+
+
+async def _match_faces_remote(query: Any, top_k: int) -> Optional[List[Tuple[int, float]]]:
+    """Top-k (user_id, similarity) computed by Postgres, or None to fall back to the local corpus.
+
+    Requires the pgvector column, index and RPC on the Supabase side. Rows
+    enrolled before FACE_PGVECTOR was turned on need the backfill, and the
+    index should be (re)built after it so the ivfflat lists reflect real data:
+
+        create extension if not exists vector;
+        alter table face_embeddings add column emb vector(512);
+        update face_embeddings set emb = embedding::vector where emb is null;
+        create index on face_embeddings using ivfflat (emb vector_cosine_ops) with (lists = 100);
+        create or replace function match_faces(query vector(512), k int)
+        returns table (user_id int, similarity float) language sql stable
+        set ivfflat.probes = 10 as $$
+            select user_id, 1 - (emb <=> query) as similarity
+            from face_embeddings where emb is not null
+            order by emb <=> query limit k
+        $$;
+
+    ``set ivfflat.probes`` on the function scopes the setting to each call, like
+    ``set local`` inside a transaction; the default of 1 probe misses neighbours.
+    """
+    if not (FACE_PGVECTOR and SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY):
+        return None
+    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/rpc/match_faces"
+    try:
+        r = await get_client().post(url, json={"query": _pgvector_literal(query), "k": top_k})
+    except httpx.HTTPError as e:
+        print(f"[WARN] match_faces RPC failed, using local corpus: {e}")
+        return None
+    if r.status_code >= 400:
+        print(f"[WARN] match_faces RPC returned {r.status_code}, using local corpus")
+        return None
+    return [(int(row["user_id"]), float(row["similarity"])) for row in r.json()]
+
+
+# In-memory search corpus built from load_all_embeddings(). Rows are unit-norm
+# float32 so similarity against every stored embedding is a single matmul.
+# Rebuilt lazily whenever _corpus_version moves past the cached build.
+# FACE_INDEX_DTYPE=int8 keeps rows scalar-quantized instead (4x less memory).
+EMBEDDING_DIM = 512
+FACE_INDEX_DTYPE = os.getenv("FACE_INDEX_DTYPE", "float32").lower()
+# Seconds a Supabase-backed corpus is trusted before refetching, so embeddings
+# written by other processes are picked up. The local store is only written here.
+FACE_EMB_CACHE_TTL = float(os.getenv("FACE_EMB_CACHE_TTL", "60"))
+# Rows upcast per block during int8 scans, bounding the temporary float32 copy
+_INT8_BLOCK_ROWS = 4096
+# Corpora with at least this many rows are first filtered by Hamming distance on
+# 1-bit (sign) codes; only the closest candidates are rescored exactly.
+FACE_BINARY_MIN_ROWS = int(os.getenv("FACE_BINARY_MIN_ROWS", "100000"))
+_BINARY_RESCORE_FACTOR = 4
+_BINARY_MIN_CANDIDATES = 256
+# With faiss installed, corpora of at least FACE_ANN_MIN_ROWS rows get an HNSW
+# inner-product index (== cosine on unit vectors) for candidate search; set to 0
+# to disable. For the local store the index is persisted next to the shards.
+FACE_ANN_MIN_ROWS = int(os.getenv("FACE_ANN_MIN_ROWS", "20000"))
+_HNSW_M = 32
+_HNSW_EF_SEARCH = 128
+_ANN_MIN_CANDIDATES = 64
+# FACE_NUMBA=1 scores float32 corpora with a numba-compiled kernel instead of a
+# BLAS matmul; useful on CPU builds without an optimized BLAS, or tiny corpora
+# where BLAS call overhead dominates. The default "auto" turns it on only when
+# NumPy was built against a reference (unoptimized) BLAS and numba is installed,
+# so the fallback order is Faiss/BLAS matmul, then numba, then plain NumPy.
+# Compiled (and cached) at import time.
+FACE_NUMBA = os.getenv("FACE_NUMBA", "auto").lower()
+_OPTIMIZED_BLAS = ("openblas", "mkl", "accelerate", "blis", "armpl", "nvpl")
+
+
+def _numpy_has_optimized_blas() -> bool:
     try:
-        return json.loads(text)
+        import numpy as _np_cfg  # type: ignore
+
+        blas = _np_cfg.__config__.CONFIG["Build Dependencies"]["blas"]
     except Exception:
-        return text
+        # Older NumPy without the structured config: assume the usual OpenBLAS wheel
+        return True
+    name = str(blas.get("name", "")).lower()
+    return bool(blas.get("found")) and any(lib in name for lib in _OPTIMIZED_BLAS)
+
+
+def _compile_numba_kernel():
+    """The numba scoring kernel, compiled and warmed up, or None when FACE_NUMBA doesn't apply."""
+    if not (FACE_NUMBA in ("1", "true", "yes") or (FACE_NUMBA == "auto" and not _numpy_has_optimized_blas())):
+        return None
+    try:
+        import numba as _numba  # type: ignore
+        import numpy as _np_nb  # type: ignore
+
+        @_numba.njit(cache=True, fastmath=True, parallel=True)
+        def kernel(corpus, queries, out):
+            n, d = corpus.shape
+            for i in _numba.prange(n):
+                for j in range(queries.shape[0]):
+                    acc = _np_nb.float32(0.0)
+                    for k in range(d):
+                        acc += corpus[i, k] * queries[j, k]
+                    out[j, i] = acc
+
+        kernel(
+            _np_nb.zeros((1, EMBEDDING_DIM), _np_nb.float32),
+            _np_nb.zeros((1, EMBEDDING_DIM), _np_nb.float32),
+            _np_nb.empty((1, 1), _np_nb.float32),
+        )
+    except Exception as e:
+        if FACE_NUMBA != "auto":
+            print(f"[WARN] FACE_NUMBA set but numba kernel unavailable, using numpy: {e}")
+        return None
+    return kernel
+
+
+_numba_cosine = _compile_numba_kernel()
+
 
+class _Corpus(NamedTuple):
+    version: int
+    mat: Any         # (N, D) float32 unit-norm rows, or int8 when quantized
+    scales: Any      # (N,) float32 dequantization scale per row, None for float32
+    uids: Any        # (N,) user_id per row
+    user_ids: Any    # (U,) distinct user ids
+    user_index: Any  # (N,) row -> position in user_ids
+    loaded_at: float  # time.monotonic() of the backing-store fetch
+    bits: Any = None  # (N, D/8) uint8 packed sign bits for the binary prefilter, or None
+    ann: Any = None   # faiss HNSW index over the float32 rows, or None
 
-def _read_local() -> List[Dict[str, Any]]:
-    if not LOCAL_EMB_PATH.exists():
-        return []
+
+def quantize_i8(vecs) -> Tuple[Any, Any]:
+    """Symmetric per-vector int8 quantization (SQ8).
+
+    Accepts a (D,) vector or (N, D) matrix; returns the int8 codes and the
+    float32 scale(s) such that vec ~= codes * scale.
+    """
+    _load_deps()
+    v = _np.asarray(vecs, dtype=_np.float32)
+    max_abs = _np.max(_np.abs(v), axis=-1, keepdims=True)
+    scale = _np.where(max_abs > 0.0, max_abs / 127.0, 1.0).astype(_np.float32)
+    codes = _np.clip(_np.rint(v / scale), -127, 127).astype(_np.int8)
+    return codes, scale[..., 0]
+
+
+_corpus_version = 0
+_corpus: Optional[_Corpus] = None
+# load_all_embeddings() fetches started / currently awaiting in _load_corpus
+_corpus_loads_started = 0
+_corpus_loads_in_flight = 0
+
+
+def _invalidate_corpus() -> None:
+    global _corpus_version
+    _corpus_version += 1
+
+
+def _append_to_corpus(user_id: int, embeddings: List[Any]) -> None:
+    """Add freshly saved embeddings to the cached corpus instead of forcing a reload."""
+    global _corpus
+    _invalidate_corpus()
+    cur = _corpus
+    if cur is None or cur.version != _corpus_version - 1:
+        return
     try:
-        return json.loads(LOCAL_EMB_PATH.read_text(encoding="utf-8"))
+        rows = _np.array(embeddings, dtype=_np.float32).reshape(-1, EMBEDDING_DIM)
+    except ValueError:
+        return
+    norms = _np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    rows /= norms
+    if cur.ann is not None:
+        # HNSW supports incremental adds; the persisted copy is rebuilt on next load
+        cur.ann.add(rows)
+    # Sign codes come from the float rows, as in _load_corpus
+    bits = cur.bits
+    if bits is not None:
+        bits = _np.concatenate([bits, _np.packbits(rows > 0, axis=1)])
+    scales = cur.scales
+    if scales is not None:
+        rows, row_scales = quantize_i8(rows)
+        scales = _np.concatenate([scales, row_scales])
+    hit = _np.flatnonzero(cur.user_ids == user_id)
+    if hit.size:
+        user_ids, pos = cur.user_ids, int(hit[0])
+    else:
+        user_ids, pos = _np.append(cur.user_ids, user_id), cur.user_ids.shape[0]
+    k = rows.shape[0]
+    _corpus = cur._replace(
+        bits=bits,
+        version=_corpus_version,
+        mat=_np.concatenate([cur.mat, rows]),
+        scales=scales,
+        uids=_np.concatenate([cur.uids, _np.full(k, user_id, dtype=cur.uids.dtype)]),
+        user_ids=user_ids,
+        user_index=_np.concatenate([cur.user_index, _np.full(k, pos, dtype=cur.user_index.dtype)]),
+    )
+
+
+def _corpus_fresh(corpus: _Corpus) -> bool:
+    if not (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY):
+        return True
+    return time.monotonic() - corpus.loaded_at < FACE_EMB_CACHE_TTL
+
+
+async def _load_corpus() -> _Corpus:
+    global _corpus, _corpus_loads_started, _corpus_loads_in_flight
+    version = _corpus_version
+    if _corpus is not None and _corpus.version == version and _corpus_fresh(_corpus):
+        return _corpus
+    loaded_at = time.monotonic()
+    _corpus_loads_started += 1
+    _corpus_loads_in_flight += 1
+    try:
+        mat, uid_arr = await load_all_embeddings()
+    finally:
+        _corpus_loads_in_flight -= 1
+    # Copy: local rows may be a read-only memmap and are normalized in place
+    mat = _np.array(mat, dtype=_np.float32).reshape(-1, EMBEDDING_DIM)
+    # Stored embeddings are written unit-norm; only rescale rows that aren't
+    norms = _np.linalg.norm(mat, axis=1)
+    off = _np.abs(norms - 1.0) > 1e-4
+    if off.any():
+        fix = norms[off]
+        fix[fix == 0.0] = 1.0
+        mat[off] /= fix[:, None]
+    bits = _np.packbits(mat > 0, axis=1) if mat.shape[0] >= FACE_BINARY_MIN_ROWS else None
+    ann = _build_ann_index(mat)
+    scales = None
+    if FACE_INDEX_DTYPE == "int8":
+        mat, scales = quantize_i8(mat)
+    user_ids, user_index = _np.unique(uid_arr, return_inverse=True)
+    _corpus = _Corpus(version, mat, scales, uid_arr, user_ids, user_index, loaded_at, bits, ann)
+    return _corpus
+
+
+def _build_ann_index(mat):
+    """HNSW index over unit-norm float32 rows, or None when faiss/size don't warrant one."""
+    n = mat.shape[0]
+    if FACE_ANN_MIN_ROWS <= 0 or n < FACE_ANN_MIN_ROWS:
+        return None
+    try:
+        import faiss  # type: ignore
     except Exception:
-        return []
+        return None
+    persist = not (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)
+    if persist and LOCAL_ANN_PATH.exists():
+        try:
+            index = faiss.read_index(str(LOCAL_ANN_PATH))
+            # The local store is append-only, so a matching row count means matching rows
+            if index.ntotal == n:
+                index.hnsw.efSearch = _HNSW_EF_SEARCH
+                return index
+        except Exception:
+            pass
+    index = faiss.IndexHNSWFlat(EMBEDDING_DIM, _HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efSearch = _HNSW_EF_SEARCH
+    index.add(_np.ascontiguousarray(mat, dtype=_np.float32))
+    if persist:
+        try:
+            tmp = LOCAL_ANN_PATH.with_name(LOCAL_ANN_PATH.name + ".tmp")
+            faiss.write_index(index, str(tmp))
+            os.replace(tmp, LOCAL_ANN_PATH)
+        except Exception as e:
+            print(f"[WARN] Failed to persist face ANN index: {e}")
+    return index
+
 
+def _corpus_scores(corpus: _Corpus, queries, rows=None):
+    """Cosine similarity of unit-norm float32 queries (F, D) against corpus rows -> (F, N).
 
-def _write_local(items: List[Dict[str, Any]]) -> None:
+    rows optionally restricts scoring to a subset of row indices.
+    """
+    mat, scales = corpus.mat, corpus.scales
+    if rows is not None:
+        mat = mat[rows]
+        scales = None if scales is None else scales[rows]
+    if scales is None:
+        if _numba_cosine is not None:
+            out = _np.empty((queries.shape[0], mat.shape[0]), dtype=_np.float32)
+            _numba_cosine(mat, _np.ascontiguousarray(queries, dtype=_np.float32), out)
+            return out
+        return queries @ mat.T
+    q8, q_scales = quantize_i8(queries)
+    # int8 codes are multiplied as float32 so the product goes through BLAS (NumPy's
+    # integer matmul doesn't). It stays exact: |dot| <= 512 * 127 * 127 < 2**24.
+    qf = q8.astype(_np.float32).T
+    n = mat.shape[0]
+    out = _np.empty((n, queries.shape[0]), dtype=_np.float32)
+    for start in range(0, n, _INT8_BLOCK_ROWS):
+        block = mat[start:start + _INT8_BLOCK_ROWS].astype(_np.float32)
+        out[start:start + _INT8_BLOCK_ROWS] = block @ qf
+    out *= scales[:, None]
+    return out.T * q_scales[:, None]
+
+
+_POPCOUNT8 = None
+
+
+def _popcount_u8(x):
+    """Per-byte popcount; np.bitwise_count on NumPy 2, a lookup table otherwise."""
+    global _POPCOUNT8
+    if hasattr(_np, "bitwise_count"):
+        return _np.bitwise_count(x)
+    if _POPCOUNT8 is None:
+        _POPCOUNT8 = _np.array([bin(i).count("1") for i in range(256)], dtype=_np.uint8)
+    return _POPCOUNT8[x]
+
+
+def _ann_prefilter_scores(corpus: _Corpus, queries, top_k: int):
+    """(F, N) scores holding the HNSW neighbours' exact inner products, -inf elsewhere."""
+    n = corpus.mat.shape[0]
+    n_cand = min(n, max(_BINARY_RESCORE_FACTOR * top_k, _ANN_MIN_CANDIDATES))
+    dist, idx = corpus.ann.search(_np.ascontiguousarray(queries, dtype=_np.float32), n_cand)
+    out = _np.full((queries.shape[0], n), -_np.inf, dtype=_np.float32)
+    for i in range(queries.shape[0]):
+        keep = idx[i] >= 0
+        out[i, idx[i][keep]] = dist[i][keep]
+    return out
+
+
+def _binary_prefilter_scores(corpus: _Corpus, queries, top_k: int):
+    """(F, N) scores where only each query's Hamming-nearest candidates are scored exactly.
+
+    Everything outside the candidate set is -inf, so downstream top-k/grouping is unchanged.
+    """
+    n = corpus.mat.shape[0]
+    n_cand = min(n, max(_BINARY_RESCORE_FACTOR * top_k, _BINARY_MIN_CANDIDATES))
+    q_bits = _np.packbits(queries > 0, axis=1)
+    out = _np.full((queries.shape[0], n), -_np.inf, dtype=_np.float32)
+    for i in range(queries.shape[0]):
+        ham = _popcount_u8(_np.bitwise_xor(corpus.bits, q_bits[i])).sum(axis=1, dtype=_np.uint16)
+        cand = _np.argpartition(ham, n_cand - 1)[:n_cand] if n_cand < n else _np.arange(n)
+        out[i, cand] = _corpus_scores(corpus, queries[i:i + 1], rows=cand)[0]
+    return out
+
+
+def _top_k_indices(scores, k: int):
+    """Indices of the k highest scores along the last axis, best first.
+
+    argpartition is O(N) per row; only the k survivors are sorted.
+    """
+    n = scores.shape[-1]
+    k = max(1, min(k, n))
+    if k < n:
+        idx = _np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = _np.broadcast_to(_np.arange(n), scores.shape)
+    order = _np.argsort(-_np.take_along_axis(scores, idx, axis=-1), axis=-1, kind="stable")
+    return _np.take_along_axis(idx, order, axis=-1)
+
+
+def _rank_corpus_batch(
+    corpus: _Corpus, queries: Any, top_k: int, grouped: bool
+) -> List[List[Tuple[int, float]]]:
+    """Top-k (user_id, similarity) per query row of an (F, 512) array, in one matmul.
+
+    grouped keeps the max similarity per user instead of per stored embedding.
+    """
+    q = _np.asarray(queries, dtype=_np.float32).reshape(-1, EMBEDDING_DIM)
+    if corpus.mat.shape[0] == 0 or q.shape[0] == 0:
+        return [[] for _ in range(q.shape[0])]
+    norms = _np.linalg.norm(q, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    q = q / norms
+    if corpus.ann is not None:
+        sims = _ann_prefilter_scores(corpus, q, top_k)
+    elif corpus.bits is not None:
+        sims = _binary_prefilter_scores(corpus, q, top_k)
+    else:
+        sims = _corpus_scores(corpus, q)  # (F, N)
+    if grouped:
+        best = _np.full((corpus.user_ids.shape[0], q.shape[0]), -_np.inf, dtype=_np.float32)
+        _np.maximum.at(best, corpus.user_index, sims.T)
+        ids, scores = corpus.user_ids, best.T
+    else:
+        ids, scores = corpus.uids, sims
+    top = _top_k_indices(scores, top_k)  # (F, k)
+    top_ids = ids[top].tolist()
+    top_sims = _np.take_along_axis(scores, top, axis=-1).tolist()
+    # -inf marks users/rows outside the binary prefilter's candidates
+    return [[(u, v) for u, v in zip(us, vs) if v != -math.inf] for us, vs in zip(top_ids, top_sims)]
+
+
+def _rank_corpus(corpus: _Corpus, query: Any, top_k: int, grouped: bool) -> List[Tuple[int, float]]:
+    """Top-k (user_id, similarity) for a single query."""
+    return _rank_corpus_batch(corpus, [query], top_k, grouped)[0]
+
+
+def _as_list(embedding: Any) -> List[float]:
+    """JSON-ready copy of an embedding; only needed at the Supabase boundary."""
+    return embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+
+
+def _safe_json(text: str) -> Any:
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return text
+
+
+def _rows_to_arrays(rows: List[Dict[str, Any]]) -> Tuple[Any, Any]:
+    """Convert [{"user_id", "embedding"}] rows into (float32 matrix, int32 user ids)."""
+    _load_deps()
+    vecs: List[List[float]] = []
+    uids: List[int] = []
+    for it in rows:
+        uid = it.get("user_id")
+        vec = it.get("embedding")
+        if uid is None or not isinstance(vec, list) or len(vec) != EMBEDDING_DIM:
+            continue
+        vecs.append(vec)
+        uids.append(uid)
+    mat = _np.asarray(vecs, dtype=_np.float32).reshape(-1, EMBEDDING_DIM)
+    return mat, _np.asarray(uids, dtype=_np.int32)
+
+
+def _write_shard(path: Path, arr) -> None:
+    """Replace a shard atomically (used only when migrating an older store)."""
+    tmp = path.with_name(path.name + ".tmp")
+    arr.tofile(tmp)
+    os.replace(tmp, path)
+
+
+def _migrate_local_store() -> None:
+    """Convert an embeddings.npy or legacy embeddings.json store into the f16 shards."""
+    mat = uids = None
+    source = None
+    if LOCAL_EMB_NPY_PATH.exists() and LOCAL_EMB_NPY_UIDS_PATH.exists():
+        try:
+            mat, uids = _np.load(LOCAL_EMB_NPY_PATH), _np.load(LOCAL_EMB_NPY_UIDS_PATH)
+            source = LOCAL_EMB_NPY_PATH
+        except Exception:
+            mat = uids = None
+    if mat is None and LOCAL_EMB_PATH.exists():
+        try:
+            rows = orjson.loads(LOCAL_EMB_PATH.read_bytes())
+        except Exception:
+            return
+        if not isinstance(rows, list):
+            return
+        mat, uids = _rows_to_arrays(rows)
+        source = LOCAL_EMB_PATH
+    if mat is None:
+        return
+    n = min(mat.shape[0], uids.shape[0])
+    # ids first: readers trust min(rows, ids), and a shard only becomes visible once both exist
+    _write_shard(LOCAL_EMB_UIDS_PATH, _np.ascontiguousarray(uids[:n], dtype=_np.int32))
+    _write_shard(LOCAL_EMB_MAT_PATH, _np.ascontiguousarray(mat[:n], dtype=_np.float16))
+    print(f"[INFO] Migrated {n} embeddings from {source.name} to {LOCAL_EMB_MAT_PATH.name}")
+
+
+def _read_local() -> Tuple[Any, Any]:
+    """Local embeddings as a read-only memmapped float16 (N, 512) matrix and (N,) user ids."""
+    _load_deps()
+    empty = (_np.empty((0, EMBEDDING_DIM), dtype=_np.float16), _np.empty(0, dtype=_np.int32))
+    if not LOCAL_EMB_MAT_PATH.exists():
+        with _local_lock:
+            if not LOCAL_EMB_MAT_PATH.exists():
+                _migrate_local_store()
     try:
-        LOCAL_EMB_PATH.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+        uids = _np.fromfile(LOCAL_EMB_UIDS_PATH, dtype=_np.int32)
+        row_bytes = EMBEDDING_DIM * 2
+        # Appends write the rows before the ids; ignore any row whose id isn't on disk yet
+        n = min(LOCAL_EMB_MAT_PATH.stat().st_size // row_bytes, uids.shape[0])
+        if n == 0:
+            return empty
+        mat = _np.memmap(LOCAL_EMB_MAT_PATH, dtype=_np.float16, mode="r", shape=(n, EMBEDDING_DIM))
     except Exception:
-        pass
+        return empty
+    return mat, uids[:n]
+
+
+def _append_local(user_id: int, embeddings: List[Any]) -> None:
+    with _local_lock:
+        try:
+            # Make sure an older store is migrated before appending to a fresh shard
+            _read_local()
+            rows = _np.asarray(embeddings, dtype=_np.float16).reshape(-1, EMBEDDING_DIM)
+            n_ids = LOCAL_EMB_UIDS_PATH.stat().st_size // 4 if LOCAL_EMB_UIDS_PATH.exists() else 0
+            with open(LOCAL_EMB_MAT_PATH, "ab") as fh:
+                # Drop rows (or a torn partial row) whose ids never landed in an interrupted append
+                fh.truncate(n_ids * EMBEDDING_DIM * 2)
+                fh.write(rows.tobytes())
+            with open(LOCAL_EMB_UIDS_PATH, "ab") as fh:
+                fh.write(_np.full(rows.shape[0], user_id, dtype=_np.int32).tobytes())
+        except Exception as e:
+            print(f"[WARN] Failed to store embedding locally: {e}")
 
 
 async def enroll_local(user_id: int, image_bytes: bytes) -> Dict[str, Any]:
-    embedder = FaceEmbedder()
-    emb = embedder.embed_image(image_bytes)
+    emb = await _run_embedder(FaceEmbedder.embed_image, image_bytes)
     if emb is None:
         return {"ok": False, "reason": "no_face_detected"}
     store = await save_embedding(user_id, emb)
@@ -352,19 +1161,10 @@ async def enroll_local(user_id: int, image_bytes: bytes) -> Dict[str, Any]:
 
 async def enroll_local_batch(user_id: int, images: List[bytes]) -> Dict[str, Any]:
     """Enroll multiple images for a user. Skips images with no detectable face."""
-    embedder = FaceEmbedder()
-    success = 0
-    failures: int = 0
-    reasons: List[str] = []
-    for img in images:
-        emb = embedder.embed_image(img)
-        if emb is None:
-            failures += 1
-            reasons.append("no_face_detected")
-            continue
-        _ = await save_embedding(user_id, emb)
-        success += 1
-    return {"ok": True, "enrolled": success, "skipped": failures}
+    embs = [e for e in await _run_embedder(FaceEmbedder.embed_images_batch, images) if e is not None]
+    failures = len(images) - len(embs)
+    _ = await save_embeddings_bulk(user_id, embs)
+    return {"ok": True, "enrolled": len(embs), "skipped": failures}
 
 
 async def identify_local(
@@ -375,21 +1175,15 @@ async def identify_local(
     auto_enroll_on_identify: bool = False,
     auto_enroll_min_similarity: float = 0.85,
 ) -> Dict[str, Any]:
-    embedder = FaceEmbedder()
-    query = embedder.embed_image(image_bytes)
+    query = await _run_embedder(FaceEmbedder.embed_image, image_bytes)
     if query is None:
         return {"ok": False, "reason": "no_face_detected"}
-    items = await load_all_embeddings()
-    scored: List[Tuple[int, float]] = []
-    for it in items:
-        uid = it.get("user_id")
-        vec = it.get("embedding")
-        if uid is None or not isinstance(vec, list):
-            continue
-        sim = cosine_similarity(query, vec)
-        scored.append((uid, sim))
-    scored.sort(key=lambda x: x[1], reverse=True)
-    top = scored[: max(1, top_k)]
+    top = await _match_faces_remote(query, top_k)
+    # A short answer means emb is still null on some rows (not backfilled) or
+    # the table is tiny; the local corpus sees every stored embedding.
+    if top is None or len(top) < top_k:
+        corpus = await _load_corpus()
+        top = _rank_corpus(corpus, query, top_k, grouped=False)
     results = [
         {"user_id": uid, "similarity": round(float(sim), 4), "match": bool(sim >= threshold)} for uid, sim in top
     ]
@@ -407,15 +1201,6 @@ async def identify_local(
     return {"ok": True, "results": results, "threshold": threshold, "auto_enrolled_user_id": auto_enrolled}
 
 
-def _group_by_user_max(scored: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
-    """Aggregate multiple embeddings per user by max similarity."""
-    best: Dict[int, float] = {}
-    for uid, sim in scored:
-        if uid not in best or sim > best[uid]:
-            best[uid] = sim
-    return sorted(best.items(), key=lambda x: x[1], reverse=True)
-
-
 async def identify_local_grouped(
     image_bytes: bytes,
     top_k: int = 3,
@@ -424,21 +1209,11 @@ async def identify_local_grouped(
     auto_enroll_on_identify: bool = False,
     auto_enroll_min_similarity: float = 0.85,
 ) -> Dict[str, Any]:
-    embedder = FaceEmbedder()
-    query = embedder.embed_image(image_bytes)
+    query = await _run_embedder(FaceEmbedder.embed_image, image_bytes)
     if query is None:
         return {"ok": False, "reason": "no_face_detected"}
-    items = await load_all_embeddings()
-    scored: List[Tuple[int, float]] = []
-    for it in items:
-        uid = it.get("user_id")
-        vec = it.get("embedding")
-        if uid is None or not isinstance(vec, list):
-            continue
-        sim = cosine_similarity(query, vec)
-        scored.append((uid, sim))
-    grouped = _group_by_user_max(scored)
-    top = grouped[: max(1, top_k)]
+    corpus = await _load_corpus()
+    top = _rank_corpus(corpus, query, top_k, grouped=True)
     results = [
         {"user_id": uid, "similarity": round(float(sim), 4), "match": bool(sim >= threshold)} for uid, sim in top
     ]
@@ -469,27 +1244,17 @@ async def identify_multi_local(
     If exclusive_assignment=True, ensures that each user_id is assigned to at most one face
     (greedy by descending best similarity). Adds primary_user_id per face.
     """
-    embedder = FaceEmbedder()
-    faces = embedder.embed_all_faces(image_bytes)
+    faces = await _run_embedder(FaceEmbedder.embed_all_faces, image_bytes)
     if min_prob > 0.0:
         faces = [f for f in faces if float(f.get("prob") or 0.0) >= float(min_prob)]
     if not faces:
         return {"ok": False, "reason": "no_face_detected", "faces": []}
-    items = await load_all_embeddings()
+    corpus = await _load_corpus()
+    ranked = _rank_corpus_batch(corpus, _np.stack([f["embedding"] for f in faces]), top_k_per_face, grouped=False)
     # First pass: collect matches per face without enrollment decisions
     interim: List[Dict[str, Any]] = []
-    for f in faces:
+    for f, top in zip(faces, ranked):
         query_emb = f["embedding"]
-        scored: List[Tuple[int, float]] = []
-        for it in items:
-            uid = it.get("user_id")
-            vec = it.get("embedding")
-            if uid is None or not isinstance(vec, list):
-                continue
-            sim = cosine_similarity(query_emb, vec)
-            scored.append((uid, sim))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        top = scored[: max(1, top_k_per_face)]
         matches = [
             {"user_id": uid, "similarity": round(float(sim), 4), "match": bool(sim >= threshold)}
             for uid, sim in top
@@ -570,27 +1335,17 @@ async def identify_multi_local_grouped(
     """Like identify_multi_local but groups multiple embeddings per user (max similarity).
     If exclusive_assignment=True, assigns each user_id to at most one face (greedy) and adds primary_user_id.
     """
-    embedder = FaceEmbedder()
-    faces = embedder.embed_all_faces(image_bytes)
+    faces = await _run_embedder(FaceEmbedder.embed_all_faces, image_bytes)
     if min_prob > 0.0:
         faces = [f for f in faces if float(f.get("prob") or 0.0) >= float(min_prob)]
     if not faces:
         return {"ok": False, "reason": "no_face_detected", "faces": []}
-    items = await load_all_embeddings()
+    corpus = await _load_corpus()
+    ranked = _rank_corpus_batch(corpus, _np.stack([f["embedding"] for f in faces]), top_k_per_face, grouped=True)
     # First pass: collect matches per face without enrollment decisions
     interim: List[Dict[str, Any]] = []
-    for f in faces:
+    for f, top in zip(faces, ranked):
         query_emb = f["embedding"]
-        scored: List[Tuple[int, float]] = []
-        for it in items:
-            uid = it.get("user_id")
-            vec = it.get("embedding")
-            if uid is None or not isinstance(vec, list):
-                continue
-            sim = cosine_similarity(query_emb, vec)
-            scored.append((uid, sim))
-        grouped = _group_by_user_max(scored)
-        top = grouped[: max(1, top_k_per_face)]
         matches = [
             {"user_id": uid, "similarity": round(float(sim), 4), "match": bool(sim >= threshold)}
             for uid, sim in top
@@ -654,24 +1409,15 @@ async def identify_multi_local_grouped(
 
 async def auto_enroll_if_confident(image_bytes: bytes, min_similarity: float = 0.8, min_prob: float = 0.0) -> Dict[str, Any]:
     """If exactly one face is detected and the best grouped match >= min_similarity, enroll it."""
-    embedder = FaceEmbedder()
-    faces = embedder.embed_all_faces(image_bytes)
+    faces = await _run_embedder(FaceEmbedder.embed_all_faces, image_bytes)
     # Apply probability filter if requested
     if min_prob > 0.0:
         faces = [f for f in faces if (f.get("prob") or 0.0) >= min_prob]
     if len(faces) != 1:
         return {"ok": False, "reason": "multiple_or_zero_faces", "count": len(faces)}
     query = faces[0]["embedding"]
-    items = await load_all_embeddings()
-    scored: List[Tuple[int, float]] = []
-    for it in items:
-        uid = it.get("user_id")
-        vec = it.get("embedding")
-        if uid is None or not isinstance(vec, list):
-            continue
-        sim = cosine_similarity(query, vec)
-        scored.append((uid, sim))
-    grouped = _group_by_user_max(scored)
+    corpus = await _load_corpus()
+    grouped = _rank_corpus(corpus, query, 1, grouped=True)
     if not grouped:
         return {"ok": False, "reason": "no_reference_embeddings"}
     best_user, best_sim = grouped[0]
@@ -682,40 +1428,17 @@ async def auto_enroll_if_confident(image_bytes: bytes, min_similarity: float = 0
 
 async def detect_faces_local(image_bytes: bytes) -> Dict[str, Any]:
     """Return bounding boxes (x1,y1,x2,y2) and probabilities using MTCNN only."""
-    embedder = FaceEmbedder()
+    return await _run_embedder(_detect_faces_sync, image_bytes)
+
+
+def _detect_faces_sync(embedder: FaceEmbedder, image_bytes: bytes) -> Dict[str, Any]:
     img = _open_image_bytes_rgb(image_bytes)
-    boxes, probs = embedder.mtcnn.detect(img)
-    if (boxes is None or len(boxes) == 0) and max(img.size) > 2000:
-        scale = 1600.0 / float(max(img.size))
-        new_wh = (max(1, int(img.size[0] * scale)), max(1, int(img.size[1] * scale)))
-        if FACE_DEBUG:
-            print(f"[FACE_DEBUG] detect_faces_local: initial detect failed on {img.size}, retrying at {new_wh}")
-        img_small = img.resize(new_wh)
-        boxes, probs = embedder.mtcnn.detect(img_small)
-        if boxes is not None and len(boxes) > 0:
-            img = img_small
-    if (boxes is None or len(boxes) == 0):
-        try:
-            from PIL import ImageEnhance as _ImageEnhance  # type: ignore
-            enhancer = _ImageEnhance.Contrast(img)
-            img_boost = enhancer.enhance(1.6)
-            boxes, probs = embedder.mtcnn.detect(img_boost)
-            if boxes is not None and len(boxes) > 0:
-                img = img_boost
-                if FACE_DEBUG:
-                    print("[FACE_DEBUG] detect_faces_local: contrast boost succeeded")
-        except Exception:
-            pass
-    if FACE_DEBUG:
-        try:
-            print(f"[FACE_DEBUG] detect_faces_local: boxes={0 if boxes is None else len(boxes)}, probs={[] if probs is None else [round(float(p),4) for p in probs]}")
-        except Exception:
-            pass
+    _img, boxes, probs, scale = embedder._detect_batch([img], "detect_faces_local")[0]
     results = []
     if boxes is not None and probs is not None:
         for b, p in zip(boxes, probs):
             if b is None:
                 continue
-            x1, y1, x2, y2 = [float(v) for v in b]
+            x1, y1, x2, y2 = [float(v) * scale for v in b]
             results.append({"box": [x1, y1, x2, y2], "prob": float(p) if p is not None else None})
     return {"ok": True, "count": len(results), "faces": results}
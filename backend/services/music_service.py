@@ -1,17 +1,80 @@
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 from core.config import settings
-import replicate
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import httpx
+import aiofiles
+import uuid
 
 import os
 
-# replicate needs token accessible from command line
-if settings.REPLICATE_API_TOKEN:
-    os.environ['REPLICATE_API_TOKEN'] = settings.REPLICATE_API_TOKEN
+REPLICATE_API_BASE = os.getenv("REPLICATE_API_BASE", "https://api.replicate.com")
+MUSICGEN_VERSION = "671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb"
+# Seconds between prediction status polls, and the overall generation deadline
+POLL_INTERVAL = 2.0
+PREDICTION_TIMEOUT = 300.0
 
-# Thread pool for blocking Replicate API calls
-_executor = ThreadPoolExecutor(max_workers=2)
+# Shared client so concurrent generations reuse connections to Replicate
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=60.0, follow_redirects=True)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _cancel_prediction(prediction: Dict[str, Any], headers: Dict[str, str]) -> None:
+    """Best-effort stop of a prediction we gave up on, so it doesn't keep running (and billing)."""
+    cancel_url = (prediction.get("urls") or {}).get("cancel")
+    if not cancel_url:
+        return
+    try:
+        await _get_client().post(cancel_url, headers=headers)
+    except Exception:
+        pass
+
+
+async def _run_prediction(input: Dict[str, Any]) -> Any:
+    """Start a MusicGen prediction over Replicate's REST API and poll until it finishes."""
+    client = _get_client()
+    headers = {"Authorization": f"Token {settings.REPLICATE_API_TOKEN}"}
+    r = await client.post(
+        f"{REPLICATE_API_BASE}/v1/predictions",
+        json={"version": MUSICGEN_VERSION, "input": input},
+        headers=headers,
+    )
+    if r.status_code >= 400:
+        raise RuntimeError(f"Replicate prediction failed to start: {r.status_code} {r.text}")
+    prediction = r.json()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PREDICTION_TIMEOUT
+    try:
+        while prediction.get("status") not in ("succeeded", "failed", "canceled"):
+            if loop.time() > deadline:
+                await _cancel_prediction(prediction, headers)
+                raise RuntimeError(f"Replicate prediction {prediction.get('id')} timed out")
+            await asyncio.sleep(POLL_INTERVAL)
+            r = await client.get(prediction["urls"]["get"], headers=headers)
+            if r.status_code >= 400:
+                raise RuntimeError(f"Replicate prediction poll failed: {r.status_code} {r.text}")
+            prediction = r.json()
+    except asyncio.CancelledError:
+        # The job gave up on the music (e.g. captions failed)
+        await _cancel_prediction(prediction, headers)
+        raise
+
+    if prediction["status"] != "succeeded":
+        raise RuntimeError(f"Replicate prediction {prediction['status']}: {prediction.get('error')}")
+    return prediction["output"]
 
 async def generate_music(theme_prompt: str, duration: int = 30, temp_dir: str = "/tmp") -> Dict[str, str]:
     """
@@ -47,23 +110,29 @@ async def generate_music(theme_prompt: str, duration: int = 30, temp_dir: str =
         "duration": duration
     }
     
-    # Run blocking Replicate API call in thread pool
-    loop = asyncio.get_event_loop()
-    output = await loop.run_in_executor(
-        _executor,
-        lambda: replicate.run(
-            "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb",
-            input=input
-        )
-    )
+    # Poll the prediction asynchronously instead of holding a thread for the whole generation
+    output = await _run_prediction(input)
 
     # Save to temporary file with unique name
-    import uuid
     temp_filename = f"music_{uuid.uuid4().hex[:8]}.wav"
     temp_path = os.path.join(temp_dir, temp_filename)
     
-    with open(temp_path, "wb") as file:
-        file.write(output.read())
+    # MusicGen returns the audio file URL; stream it to disk in 64 KiB chunks
+    # rather than holding the whole WAV in memory
+    try:
+        async with _get_client().stream("GET", output) as r:
+            if r.status_code >= 400:
+                raise RuntimeError(f"Failed to download generated music: {r.status_code}")
+            async with aiofiles.open(temp_path, "wb") as file:
+                async for chunk in r.aiter_bytes(1 << 16):
+                    await file.write(chunk)
+    except BaseException:
+        # Nobody gets this path back on failure (or cancellation), so don't leave a partial file
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
     
     return {
         "file_path": temp_path,
@@ -1,50 +1,346 @@
-from typing import Dict, List, Optional
+from typing import Awaitable, Dict, List, NamedTuple, Optional, Union
+from functools import lru_cache
 from api.schemas import SlideshowRequest
 from .music_service import generate_music
 from .caption_service import fetch_event_media_mapping, generate_event_captions_batch
 from .azure_service import upload_video_to_blob_storage, save_slideshow_to_database
+from core.log import get_logger
 import os
-import ffmpeg
+import shutil
 import uuid
 import random
 import httpx
-from PIL import Image
+import aiofiles
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+try:
+    # Lets Pillow open the HEIC photos ffmpeg can't decode
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import subprocess
+import textwrap
+from urllib.parse import urlparse
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-# in memory job status store
-job_status_store: Dict[str, dict] = {}
+logger = get_logger("slideshow_service")
 
-# Thread pool for blocking operations (FFmpeg)
-_executor = ThreadPoolExecutor(max_workers=2)
+@dataclass(frozen=True, slots=True)
+class JobStatus:
+    status: str = "processing"  # "processing", "completed", "failed"
+    message: str = ""
+    slideshow_url: Optional[str] = None
+    error: Optional[str] = None
 
 
-async def run_ffmpeg_async(stream) -> None:
-    """Run FFmpeg command in thread pool to avoid blocking event loop."""
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(_executor, lambda: ffmpeg.run(stream, capture_stdout=True, capture_stderr=True))
+# in memory job status store, used when REDIS_URL is not set. Ordered by last
+# update; jobs not updated for JOB_STATUS_TTL seconds, and the oldest beyond
+# JOB_STATUS_MAX_JOBS, are dropped so a long-running worker doesn't grow forever.
+# Entries are immutable and replaced whole, so readers never see a half-applied update.
+job_status_store: "OrderedDict[str, JobStatus]" = OrderedDict()
+_job_updated_at: Dict[str, float] = {}
+JOB_STATUS_MAX_JOBS = int(os.getenv("JOB_STATUS_MAX_JOBS", "10000"))
 
+# Set REDIS_URL to share job status across workers and keep it across restarts.
+# Each job is a hash at job:<id> (values JSON-encoded) expiring after JOB_STATUS_TTL
+# seconds; every change is also published on job:<id>:events.
+REDIS_URL = os.getenv("REDIS_URL")
+JOB_STATUS_TTL = int(os.getenv("JOB_STATUS_TTL", "3600"))
+_redis = None
 
-async def download_image(image_url: str, output_path: str) -> str:
-    """Download image from URL to local file."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(image_url)
+
+def _get_redis():
+    global _redis
+    if _redis is None and REDIS_URL:
+        try:
+            import redis.asyncio as redis
+            _redis = redis.from_url(REDIS_URL, decode_responses=True)
+        except ImportError:
+            logger.warning("REDIS_URL is set but redis is not installed; using in-memory job status")
+    return _redis
+
+
+async def set_job_status(job_id: str, **fields) -> None:
+    """Create or update fields of a job's status and notify subscribers."""
+    r = _get_redis()
+    if r is None:
+        now = time.monotonic()
+        job_status_store[job_id] = replace(job_status_store.get(job_id) or JobStatus(), **fields)
+        job_status_store.move_to_end(job_id)
+        _job_updated_at[job_id] = now
+        _prune_job_status(now)
+        return
+    key = f"job:{job_id}"
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={k: json.dumps(v) for k, v in fields.items()})
+        pipe.expire(key, JOB_STATUS_TTL)
+        pipe.publish(f"{key}:events", json.dumps(fields))
+        await pipe.execute()
+
+
+def _prune_job_status(now: float) -> None:
+    while job_status_store:
+        oldest = next(iter(job_status_store))
+        if len(job_status_store) <= JOB_STATUS_MAX_JOBS and now - _job_updated_at[oldest] < JOB_STATUS_TTL:
+            break
+        del job_status_store[oldest]
+        del _job_updated_at[oldest]
+
+
+async def get_job_status(job_id: str) -> Optional[JobStatus]:
+    """Current status of a job, or None if unknown (or expired)."""
+    r = _get_redis()
+    if r is None:
+        _prune_job_status(time.monotonic())
+        return job_status_store.get(job_id)
+    raw = await r.hgetall(f"job:{job_id}")
+    if not raw:
+        return None
+    return JobStatus(**{k: json.loads(v) for k, v in raw.items()})
+
+# Thread pool for blocking operations (FFmpeg, Pillow). Each slideshow is a single
+# ffmpeg render, so parallelism comes from concurrent jobs and per-image
+# preprocessing; size the pool to half the cores. SLIDESHOW_FFMPEG_WORKERS overrides.
+_FFMPEG_WORKERS = int(os.getenv("SLIDESHOW_FFMPEG_WORKERS", "0")) or max(2, (os.cpu_count() or 4) // 2)
+_executor = ThreadPoolExecutor(max_workers=_FFMPEG_WORKERS)
+# Short file operations (ffprobe, image cache, scratch cleanup) get their own small
+# pool so they never queue behind renders occupying every _executor thread
+_io_executor = ThreadPoolExecutor(max_workers=4)
+
+
+# Renders run ffmpeg across all its threads, so concurrent jobs beyond this just
+# thrash; extra jobs wait for a slot (their captions, music and image downloads
+# still run meanwhile). Defaults to one render per 4 cores (at least 2, within the
+# pool) so together their threads cover the machine; several mid-sized encodes
+# get more done than one ffmpeg spread over every core.
+SLIDESHOW_MAX_JOBS = int(os.getenv("SLIDESHOW_MAX_JOBS", "0")) or min(_FFMPEG_WORKERS, max(2, (os.cpu_count() or 4) // 4))
+_render_slots = asyncio.Semaphore(SLIDESHOW_MAX_JOBS)
+
+# Pillow preprocessing is pure CPU work holding the GIL between C calls, so it runs
+# in worker processes rather than the thread pool. Created on first use. Workers
+# come from a forkserver, not a fork of this process: forking the running app
+# would copy its event loop, pool threads and open HTTP connections mid-use.
+_preprocess_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_preprocess_pool() -> ProcessPoolExecutor:
+    global _preprocess_pool
+    if _preprocess_pool is None:
+        workers = int(os.getenv("SLIDESHOW_PREPROCESS_WORKERS", "0")) or max(1, (os.cpu_count() or 4) - 2)
+        _preprocess_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _preprocess_pool
+
+
+def shutdown_preprocess_pool() -> None:
+    """Stop the preprocessing worker processes; called from the app lifespan on shutdown."""
+    global _preprocess_pool
+    if _preprocess_pool is not None:
+        _preprocess_pool.shutdown(wait=True, cancel_futures=True)
+        _preprocess_pool = None
+
+
+def _ffmpeg_threads() -> int:
+    """
+    Threads per ffmpeg process, splitting the CPUs between the renders that can
+    run at once (render slots, bounded by the pool) instead of each ffmpeg
+    claiming every core. SLIDESHOW_FFMPEG_THREADS overrides.
+    """
+    override = os.getenv("SLIDESHOW_FFMPEG_THREADS")
+    if override:
+        return max(1, int(override))
+    concurrent = max(1, min(SLIDESHOW_MAX_JOBS, _FFMPEG_WORKERS))
+    return max(1, (os.cpu_count() or 4) // concurrent)
+
+
+async def run_ffmpeg_async(args: List[str]) -> None:
+    """Run an ffmpeg command line in the thread pool to avoid blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        _executor, lambda: subprocess.run(["ffmpeg", "-hide_banner", "-y", *args], capture_output=True)
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed: {result.stderr.decode(errors='replace')[-2000:]}")
+
+
+def _option_args(options: Dict[str, Optional[str]]) -> List[str]:
+    """{"vcodec": "libx264", "shortest": None} -> ["-vcodec", "libx264", "-shortest"]"""
+    args: List[str] = []
+    for key, value in options.items():
+        args.append(f"-{key}")
+        if value is not None:
+            args.append(str(value))
+    return args
+
+
+# Image downloads in flight per slideshow; the rest queue so a large slideshow
+# doesn't open dozens of connections to one host at once
+SLIDESHOW_DOWNLOAD_CONCURRENCY = int(os.getenv("SLIDESHOW_DOWNLOAD_CONCURRENCY", "8"))
+
+# Shared client so all image downloads reuse pooled keep-alive / HTTP/2 connections
+# instead of a TCP+TLS handshake per image. Closed from the app lifespan.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Hardware H.264 encoders in order of preference; libx264 is the software fallback.
+# SLIDESHOW_VCODEC forces a specific encoder, e.g. hevc_nvenc for smaller files where
+# players are known to handle HEVC, or libsvtav1 for AV1 at roughly half the H.264
+# size (neither is ever picked automatically).
+_HW_ENCODERS = ["h264_nvenc", "h264_videotoolbox", "h264_qsv"]
+# NVENC runs constant quality (cq, the counterpart of x264's crf) capped at maxrate
+_NVENC_OPTIONS = {"preset": "p4", "rc": "vbr", "cq": "23", "b:v": "0", "maxrate": "4M", "bufsize": "8M"}
+_ENCODER_OPTIONS = {
+    "h264_nvenc": _NVENC_OPTIONS,
+    # hvc1 tag so Apple players accept HEVC in MP4
+    "hevc_nvenc": {**_NVENC_OPTIONS, "tag:v": "hvc1"},
+    "h264_videotoolbox": {"b:v": "3M"},
+    "h264_qsv": {"b:v": "3M"},
+    # Near-static frames with a slow zoom: a fast preset at constant quality costs a
+    # fraction of the default medium preset's CPU for the same look
+    "libx264": {"preset": "veryfast", "tune": "stillimage", "crf": "23"},
+    # SVT-AV1's fastest preset keeps encode time near libx264's for slideshows
+    "libsvtav1": {"preset": "12", "crf": "32"},
+}
+_video_encoder: Optional[str] = None
+
+
+def _probe_video_encoder() -> str:
+    """First hardware encoder that can actually encode a frame here, else libx264."""
+    forced = os.getenv("SLIDESHOW_VCODEC")
+    if forced:
+        return forced
+    for codec in _HW_ENCODERS:
+        # Being listed by `ffmpeg -encoders` only means it was compiled in; a tiny
+        # test encode also proves the GPU / driver is present
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+                 "-i", "color=size=256x256:duration=0.1", "-c:v", codec, "-f", "null", "-"],
+                capture_output=True,
+                timeout=15,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if result.returncode == 0:
+            return codec
+    return "libx264"
+
+
+async def get_video_encoder() -> str:
+    """Probe once (off the event loop) and remember the encoder for later renders."""
+    global _video_encoder
+    if _video_encoder is None:
+        loop = asyncio.get_running_loop()
+        _video_encoder = await loop.run_in_executor(_io_executor, _probe_video_encoder)
+        logger.info("Using video encoder: %s", _video_encoder)
+    return _video_encoder
+
+
+def video_encoder_options(codec: str) -> Dict[str, str]:
+    """ffmpeg output options for codec, including the yuv420p pixel format players expect."""
+    return {"vcodec": codec, "pix_fmt": "yuv420p", **_ENCODER_OPTIONS.get(codec, {"b:v": "3M"})}
+
+
+def _audio_codec(path: str) -> Optional[str]:
+    """Codec name of the first audio stream in path per ffprobe, or None if it can't tell."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True,
+            text=True,
+            timeout=15,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None
+
+
+async def prewarm_dns(urls: List[str]) -> None:
+    """
+    Resolve each distinct image host once, concurrently, before the downloads start
+    so they don't all race to resolve the same name (answers are reused via the
+    system resolver cache where one is running, e.g. systemd-resolved or nscd).
+    """
+    hosts = {urlparse(u).hostname for u in urls if u.startswith("http")}
+    hosts.discard(None)
+    if not hosts:
+        return
+    loop = asyncio.get_running_loop()
+    # Failures surface on the actual download with a proper error
+    await asyncio.gather(*(loop.getaddrinfo(host, 443) for host in hosts), return_exceptions=True)
+
+
+# Content types that always go through the Pillow fallback, so there's no point
+# writing the original to disk first
+_PILLOW_CONTENT_TYPES = ("image/heic", "image/heif", "image/heic-sequence", "image/heif-sequence")
+
+
+async def download_image(image_url: str, output_path: str) -> Union[str, bytes]:
+    """
+    Download image from URL to local file and return its path. HEIC/HEIF responses
+    are returned as bytes instead, for preprocess_image to decode from memory.
+    """
+    async with get_http_client().stream("GET", image_url) as response:
         response.raise_for_status()
         
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in _PILLOW_CONTENT_TYPES:
+            return await response.aread()
+        
+        async with aiofiles.open(output_path, 'wb') as f:
+            async for chunk in response.aiter_bytes(1 << 16):
+                await f.write(chunk)
     
     return output_path
 
 
-async def preprocess_image(image_path: str, output_path: str, target_width: int = 1080, target_height: int = 1920) -> str:
+async def preprocess_image(image_path: Union[str, bytes], output_path: str, target_width: int = 1080, target_height: int = 1920) -> str:
+    """Run _preprocess_image_sync in the process pool so other downloads progress meanwhile."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_preprocess_pool(), _preprocess_image_sync, image_path, output_path, target_width, target_height
+    )
+
+
+def _preprocess_image_sync(image_path: Union[str, bytes], output_path: str, target_width: int = 1080, target_height: int = 1920) -> str:
     """
     Preprocess image to handle different resolutions and aspect ratios.
-    Resizes and pads image to target resolution while maintaining aspect ratio.
+    Resizes and center-crops image to fill the target resolution while maintaining aspect ratio.
     TikTok/mobile vertical format: 1080x1920 (9:16).
     
     Args:
-        image_path: Path to source image
+        image_path: Path to source image, or its encoded bytes
         output_path: Path to save processed image
         target_width: Target width (default: 1080 for mobile)
         target_height: Target height (default: 1920 for mobile)
@@ -52,7 +348,11 @@ async def preprocess_image(image_path: str, output_path: str, target_width: int
     Returns:
         Path to processed image
     """
-    with Image.open(image_path) as img:
+    with Image.open(io.BytesIO(image_path) if isinstance(image_path, bytes) else image_path) as img:
+        # For JPEGs, let libjpeg decode at 1/2, 1/4 or 1/8 scale while the result still
+        # covers the target; no-op for other formats and never upscales
+        img.draft('RGB', (target_width, target_height))
+        
         # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
         if img.mode != 'RGB':
             img = img.convert('RGB')
@@ -61,102 +361,602 @@ async def preprocess_image(image_path: str, output_path: str, target_width: int
         img_aspect = img.width / img.height
         target_aspect = target_width / target_height
         
-        # Resize to fill the frame while maintaining aspect ratio
+        # Source region that fills the frame while maintaining aspect ratio (the
+        # overflow is center-cropped), so only that region gets resampled
         if img_aspect > target_aspect:
             # Image is wider - fit to height
-            new_height = target_height
-            new_width = int(target_height * img_aspect)
+            crop_width = img.height * target_aspect
+            box = ((img.width - crop_width) / 2, 0, (img.width + crop_width) / 2, img.height)
         else:
             # Image is taller - fit to width
-            new_width = target_width
-            new_height = int(target_width / img_aspect)
+            crop_height = img.width / target_aspect
+            box = (0, (img.height - crop_height) / 2, img.width, (img.height + crop_height) / 2)
         
-        # Resize image
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # reducing_gap shrinks large sources with a cheap box reduce first and leaves
+        # only the last ~3x to Lanczos, as Image.thumbnail does
+        processed = img.resize((target_width, target_height), Image.Resampling.LANCZOS, box=box, reducing_gap=3.0)
         
-        # Create new image with target size and black background
-        processed = Image.new('RGB', (target_width, target_height), (0, 0, 0))
-        
-        # Paste resized image in center
-        x_offset = (target_width - new_width) // 2
-        y_offset = (target_height - new_height) // 2
-        processed.paste(img, (x_offset, y_offset))
-        
-        # Save
-        processed.save(output_path, 'JPEG', quality=95)
+        # Save losslessly: a JPEG here would be a second lossy generation before x264,
+        # and PNG at the lowest compression level encodes faster than a JPEG at q90
+        processed.save(output_path, 'PNG', compress_level=1)
     
     return output_path
 
 
-def get_ken_burns_params(duration: float) -> Dict[str, any]:
+# Output format: TikTok/mobile vertical 1080x1920 (9:16) at 30fps
+VIDEO_WIDTH = 1080
+VIDEO_HEIGHT = 1920
+VIDEO_FPS = 30
+
+
+class KenBurnsParams(NamedTuple):
+    zoom_start: float
+    zoom_end: float
+
+
+# More subtle zoom for better effect
+_ZOOM_IN = KenBurnsParams(1.0, 1.2)
+_ZOOM_OUT = KenBurnsParams(1.2, 1.0)
+
+
+def get_ken_burns_params() -> KenBurnsParams:
     """
-    Get Ken Burns effect parameters with subtle zoom and pan.
-    
-    Args:
-        duration: Duration of the effect in seconds
-    
-    Returns:
-        Dictionary with zoom and pan parameters
+    Get Ken Burns effect parameters: a subtle zoom in or out, picked at random.
     """
-    zoom_in = random.choice([True, False])
-    
-    # More subtle zoom for better effect
-    return {
-        "zoom_in": zoom_in,
-        "zoom_start": 1.0 if zoom_in else 1.2,
-        "zoom_end": 1.2 if zoom_in else 1.0,
-        "duration": duration,
-        "fps": 30,
-        "width": 1080,
-        "height": 1920
-    }
+    return _ZOOM_IN if random.getrandbits(1) else _ZOOM_OUT
 
 
+@lru_cache(maxsize=512)
 def wrap_text(text: str, max_chars_per_line: int = 35) -> str:
     """
     Wrap text to fit within a certain character width.
-    Breaks at word boundaries when possible.
+    Breaks at word boundaries; words longer than a line are kept whole.
     """
-    words = text.split()
-    lines = []
-    current_line = []
-    current_length = 0
+    return '\n'.join(textwrap.wrap(text, width=max_chars_per_line, break_long_words=False))
+
+
+# Scratch space for downloaded images, the captions file and the rendered video. tmpfs (/dev/shm) keeps
+# them in RAM on Linux, but only when it has room: Docker gives containers a 64 MB /dev/shm by default,
+# which a single render overflows. SLIDESHOW_TMPDIR overrides, /tmp is the fallback.
+_SHM_MIN_FREE_MB = int(os.getenv("SLIDESHOW_SHM_MIN_FREE_MB", "1024"))
+
+
+def _default_tmpdir() -> str:
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        return "/tmp"
+    if not os.access("/dev/shm", os.W_OK) or st.f_bavail * st.f_frsize < _SHM_MIN_FREE_MB * 1024 * 1024:
+        return "/tmp"
+    return "/dev/shm"
+
+
+SLIDESHOW_TMPDIR = os.getenv("SLIDESHOW_TMPDIR") or _default_tmpdir()
+
+
+# Optional on-disk LRU cache of fetched (and, where needed, preprocessed) images keyed
+# by the SHA-1 of their URL, so re-rendering an event (retry, new theme or music)
+# skips the downloads. Enabled by setting SLIDESHOW_IMAGE_CACHE_DIR; least recently
+# used files are evicted beyond SLIDESHOW_IMAGE_CACHE_MB.
+SLIDESHOW_IMAGE_CACHE_DIR = os.getenv("SLIDESHOW_IMAGE_CACHE_DIR")
+SLIDESHOW_IMAGE_CACHE_MB = int(os.getenv("SLIDESHOW_IMAGE_CACHE_MB", "1024"))
+
+
+def _image_cache_path(image_url: str) -> str:
+    return os.path.join(SLIDESHOW_IMAGE_CACHE_DIR, hashlib.sha1(image_url.encode("utf-8")).hexdigest())
+
+
+def _restore_cached_image(image_url: str, output_path: str) -> bool:
+    """Link (or copy) the cached image for image_url to output_path; False on a miss."""
+    cached = _image_cache_path(image_url)
+    try:
+        # Bump the mtime: eviction goes by least recently used
+        os.utime(cached)
+        try:
+            os.link(cached, output_path)
+        except OSError:
+            # Cache on another filesystem than the scratch dir
+            shutil.copyfile(cached, output_path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        # Unreadable entry, full scratch dir, ...: refetch rather than fail the job
+        logger.warning("Failed to restore cached image %s: %s", image_url, e)
+        return False
+    return True
+
+
+def _store_cached_image(image_url: str, image_path: str) -> None:
+    os.makedirs(SLIDESHOW_IMAGE_CACHE_DIR, exist_ok=True)
+    cached = _image_cache_path(image_url)
+    # Copy under a temporary name and rename, so readers never see a partial file
+    tmp_path = f"{cached}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(image_path, tmp_path)
+        os.replace(tmp_path, cached)
+    except OSError:
+        # Don't strand a partial copy in the cache dir
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _evict_image_cache() -> None:
+    """Delete least recently used cache files until the cache fits its size budget."""
+    entries = []
+    with os.scandir(SLIDESHOW_IMAGE_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    budget = SLIDESHOW_IMAGE_CACHE_MB << 20
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# ISO-BMFF brands of HEIC/HEIF photos (iPhone default), which ffmpeg can't decode as stills
+_HEIF_BRANDS = (b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1")
+
+
+def needs_pillow_preprocess(image_path: str) -> bool:
+    """
+    True for images ffmpeg can't render correctly itself: HEIC/HEIF, and CMYK JPEGs
+    (Adobe's inverted CMYK comes out as a negative). Pillow converts those first.
+    """
+    with open(image_path, "rb") as f:
+        header = f.read(12)
+    if header[4:8] == b"ftyp" and header[8:12] in _HEIF_BRANDS:
+        return True
+    if header[:2] != b"\xff\xd8":
+        return False
+    # Image.open only parses the JPEG header; pixels are never decoded here
+    try:
+        with Image.open(image_path) as img:
+            return img.mode == "CMYK"
+    except OSError:
+        return False
+
+
+def jpeg_lowres(image_path: str, width: int = VIDEO_WIDTH, height: int = VIDEO_HEIGHT) -> int:
+    """
+    ffmpeg -lowres level (0-3) for a JPEG: the largest 1/2^n IDCT-scaled decode that
+    still covers width x height, so big photos are decoded at a fraction of their
+    pixels before the Lanczos scale instead of convolving all of them. 0 otherwise.
+    """
+    with open(image_path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return 0
+    try:
+        with Image.open(image_path) as img:
+            src_w, src_h = img.size
+    except OSError:
+        return 0
+    level = 0
+    while level < 3 and src_w >> (level + 1) >= width and src_h >> (level + 1) >= height:
+        level += 1
+    return level
+
+
+# Per-image filter chain, formatted once per zoom direction instead of walking an
+# ffmpeg-python graph: fill the frame keeping aspect ratio and center-crop the
+# overflow (same framing as the Pillow preprocessing), then a linear Ken Burns
+# zoom. Each input is a single still frame and zoompan emits d frames from it,
+# so every segment is exactly {frames} long.
+_SEGMENT_FILTER = (
+    f"scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=increase:flags=lanczos,"
+    f"crop={VIDEO_WIDTH}:{VIDEO_HEIGHT},setsar=1,"
+    f"zoompan=z='{{zoom_start}}+({{zoom_end}}-{{zoom_start}})*(on/{{frames}})'"
+    f":d={{frames}}:s={VIDEO_WIDTH}x{VIDEO_HEIGHT}:fps={VIDEO_FPS}"
+)
+_XFADE_FILTER = "[{prev}][s{idx}]xfade=transition=fade:duration={duration}:offset={offset}[x{idx}]"
+
+
+class SegmentSpec(NamedTuple):
+    """One image of the slideshow as rendered: its file, caption and Ken Burns zoom."""
+    image_path: str
+    caption: str
+    ken_burns: KenBurnsParams
+
+
+def build_segment(
+    idx: int, total_frames: int, src: Optional[str] = None, ken_burns: Optional[KenBurnsParams] = None
+) -> str:
+    """
+    Filter chain for image idx read from stream src (input idx by default): Ken Burns
+    zoom (random unless given) over exactly total_frames frames, output as [s<idx>].
+    """
+    chain = _segment_chain(ken_burns or get_ken_burns_params(), total_frames)
+    return f"[{src or f'{idx}:v'}]{chain}[s{idx}]"
+
+
+@lru_cache(maxsize=8)
+def _segment_chain(params: KenBurnsParams, total_frames: int) -> str:
+    # Only the zoom direction and segment length vary, so each chain is formatted once
+    return _SEGMENT_FILTER.format(zoom_start=params.zoom_start, zoom_end=params.zoom_end, frames=total_frames)
+
+
+# Caption style for the ass filter: white 40px text on a 50% black box padded by
+# 20px, bottom-centered 80px above the edge. libass finds the font through
+# fontconfig (falling back to any sans face), so no platform-specific font path;
+# SLIDESHOW_FONTS_DIR adds a directory of bundled fonts.
+CAPTION_FONT = os.getenv("SLIDESHOW_CAPTION_FONT", "Arial")
+SLIDESHOW_FONTS_DIR = os.getenv("SLIDESHOW_FONTS_DIR")
+_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Caption,{font},40,&H00FFFFFF,&H00FFFFFF,&H80000000,&H80000000,0,0,0,0,100,100,0,0,3,20,0,2,40,40,80,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+# Braces would start ASS override tags and a backslash could form \N / \h escapes
+# with the next letter (a word joiner after it prevents that); newlines become \N
+_ASS_TEXT_ESCAPES = str.maketrans({"{": "\\{", "}": "\\}", "\\": "\\\u2060", "\n": "\\N"})
+
+
+def _ass_time(seconds: float) -> str:
+    centis = int(round(seconds * 100))
+    return f"{centis // 360000}:{centis // 6000 % 60:02d}:{centis // 100 % 60:02d}.{centis % 100:02d}"
+
+
+def write_captions_ass(
+    path: str,
+    caption_texts: List[str],
+    duration_per_image: float,
+    crossfade_duration: float,
+    width: int = VIDEO_WIDTH,
+    height: int = VIDEO_HEIGHT,
+) -> str:
+    """
+    Write all captions as one .ass subtitle file timed to the slideshow, so the
+    whole video is captioned by a single ass filter (libass caches the rendered
+    glyphs) instead of a drawtext per image.
+    """
+    step = duration_per_image - crossfade_duration
+    total = len(caption_texts) * step + crossfade_duration
+    lines = [_ASS_HEADER.format(width=width, height=height, font=CAPTION_FONT)]
+    for idx, text in enumerate(caption_texts):
+        if not text:
+            continue
+        # Switch captions as the crossfade into the next image begins, so they never stack
+        start = idx * step
+        end = (idx + 1) * step if idx < len(caption_texts) - 1 else total
+        # Wrap text for better display on mobile, then escape it in one pass
+        safe = wrap_text(text, max_chars_per_line=35).translate(_ASS_TEXT_ESCAPES)
+        lines.append(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Caption,,0,0,0,,{safe}\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return path
+
+
+# SLIDESHOW_RENDERER=pyav renders in-process with PyAV (optional dependency, `pip
+# install av`) instead of spawning ffmpeg: frames stay numpy arrays, Ken Burns is a
+# crop + resize, crossfades are alpha blends and captions are a pre-drawn overlay.
+# Falls back to the ffmpeg render when av isn't installed.
+SLIDESHOW_RENDERER = os.getenv("SLIDESHOW_RENDERER", "ffmpeg").lower()
+_PYAV_ENCODER_OPTIONS = {
+    "h264_nvenc": {"preset": "p4", "rc": "vbr", "cq": "23", "maxrate": "4M", "bufsize": "8M"},
+    "hevc_nvenc": {"preset": "p4", "rc": "vbr", "cq": "23", "maxrate": "4M", "bufsize": "8M"},
+    "libx264": _ENCODER_OPTIONS["libx264"],
+    "libsvtav1": _ENCODER_OPTIONS["libsvtav1"],
+}
+
+
+def _pyav_available() -> bool:
+    return importlib.util.find_spec("av") is not None
+
+
+def _load_caption_font(size: int = 40):
+    candidates = [CAPTION_FONT, f"{CAPTION_FONT}.ttf", "DejaVuSans.ttf"]
+    if SLIDESHOW_FONTS_DIR:
+        candidates = [os.path.join(SLIDESHOW_FONTS_DIR, f"{CAPTION_FONT}.ttf")] + candidates
+    for name in candidates:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _caption_overlay(text: str, font, width: int = VIDEO_WIDTH, height: int = VIDEO_HEIGHT):
+    """
+    Caption drawn once as (RGBA image, paste position), styled like the ass captions:
+    white text on a 50% black box padded by 20px, bottom-centered 80px above the edge.
+    """
+    wrapped = wrap_text(text, max_chars_per_line=35)
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = probe.multiline_textbbox((0, 0), wrapped, font=font, align="center")
+    pad = 20
+    box_w, box_h = int(right - left) + 2 * pad, int(bottom - top) + 2 * pad
+    overlay = Image.new("RGBA", (box_w, box_h), (0, 0, 0, 128))
+    ImageDraw.Draw(overlay).multiline_text(
+        (pad - left, pad - top), wrapped, font=font, fill=(255, 255, 255, 255), align="center"
+    )
+    return overlay, ((width - box_w) // 2, height - 80 - box_h)
+
+
+def _ken_burns_boxes(total_frames: int, zoom_start: float, zoom_end: float, width: int, height: int):
+    """
+    (total_frames, 4) array of per-frame crop boxes (left, top, right, bottom) into an
+    image of width x height, zoomed linearly from zoom_start to zoom_end (relative to
+    the larger of the two) and anchored top-left like zoompan's default x/y.
+    """
+    zooms = np.linspace(zoom_start, zoom_end, total_frames, endpoint=False, dtype=np.float32)
+    scale = max(zoom_start, zoom_end) / zooms
+    boxes = np.zeros((total_frames, 4), dtype=np.float32)
+    boxes[:, 2] = width * scale
+    boxes[:, 3] = height * scale
+    return boxes
+
+
+def _ken_burns_frames(
+    image_path: str,
+    total_frames: int,
+    ken_burns: KenBurnsParams,
+    width: int = VIDEO_WIDTH,
+    height: int = VIDEO_HEIGHT,
+):
+    """
+    Yield the total_frames RGB frames of one image's Ken Burns segment as numpy arrays.
+    The image is cover-resized once at the maximum zoom so each frame is just a crop
+    of it, from a precomputed table of boxes, scaled to the output size.
+    """
+    zoom_start, zoom_end = ken_burns
+    max_zoom = max(zoom_start, zoom_end)
+    base_w, base_h = int(width * max_zoom), int(height * max_zoom)
+    with Image.open(image_path) as img:
+        img.draft("RGB", (base_w, base_h))
+        img = img.convert("RGB")
+        scale = max(base_w / img.width, base_h / img.height)
+        resized = img.resize((max(base_w, round(img.width * scale)), max(base_h, round(img.height * scale))), Image.LANCZOS)
+    left, top = (resized.width - base_w) // 2, (resized.height - base_h) // 2
+    base = resized.crop((left, top, left + base_w, top + base_h))
+    for box in _ken_burns_boxes(total_frames, zoom_start, zoom_end, width, height).tolist():
+        yield np.asarray(base.resize((width, height), Image.BILINEAR, box=box))
+
+
+def _pyav_encoder(av) -> str:
+    """Encoder for the PyAV render: the probed ffmpeg choice when this av build has it, else libx264."""
+    for codec in (_video_encoder, "libx264"):
+        if codec:
+            try:
+                av.Codec(codec, "w")
+                return codec
+            except Exception:
+                continue
+    return "libx264"
+
+
+def _render_pyav_sync(
+    specs: List[SegmentSpec],
+    music_file_path: Optional[str],
+    duration_per_image: float,
+    crossfade_duration: float,
+    total_duration: float,
+    output_path: str,
+) -> None:
+    """Render the whole slideshow, captions and music included, to output_path with PyAV."""
+    import av
+
+    total_frames = int(duration_per_image * VIDEO_FPS)
+    fade_frames = int(crossfade_duration * VIDEO_FPS)
+    step_frames = total_frames - fade_frames
+    font = _load_caption_font()
+    overlays = [_caption_overlay(spec.caption, font) if spec.caption else None for spec in specs]
+
+    container = av.open(output_path, mode="w", options={"movflags": "+faststart"})
+    music = None
+    try:
+        codec = _pyav_encoder(av)
+        options = _PYAV_ENCODER_OPTIONS.get(codec, {})
+        video = container.add_stream(codec, rate=VIDEO_FPS, options=options)
+        video.width = VIDEO_WIDTH
+        video.height = VIDEO_HEIGHT
+        video.pix_fmt = "yuv420p"
+        if "crf" not in options and "cq" not in options:
+            video.bit_rate = 3_000_000
+        video.thread_count = _ffmpeg_threads()
+        video.thread_type = "AUTO"
+
+        # Streams must all exist before the first packet is muxed
+        audio = None
+        if music_file_path and os.path.exists(music_file_path):
+            music = av.open(music_file_path)
+            audio = container.add_stream("aac", rate=music.streams.audio[0].rate or 44100)
+            audio.bit_rate = 192_000
+
+        frame_index = 0
+
+        def emit(arr) -> None:
+            nonlocal frame_index
+            # Captions switch as the crossfade into the next image begins, as in the ass render
+            overlay = overlays[min(frame_index // step_frames, len(overlays) - 1)]
+            if overlay is not None:
+                img = Image.fromarray(arr)
+                img.paste(overlay[0], overlay[1], overlay[0])
+                frame = av.VideoFrame.from_image(img)
+            else:
+                frame = av.VideoFrame.from_ndarray(arr, format="rgb24")
+            frame.pts = frame_index
+            frame_index += 1
+            container.mux(video.encode(frame))
+
+        tail: List = []
+        for idx, spec in enumerate(specs):
+            last = idx == len(specs) - 1
+            next_tail = []
+            for i, arr in enumerate(_ken_burns_frames(spec.image_path, total_frames, spec.ken_burns)):
+                if i < len(tail):
+                    # Linear fade from the previous image's held-back frames into this one
+                    alpha = i / fade_frames
+                    arr = (tail[i] * (1 - alpha) + arr * alpha).astype(np.uint8)
+                if not last and i >= step_frames:
+                    # Held back to blend with the start of the next image
+                    next_tail.append(arr)
+                    continue
+                emit(arr)
+            tail = next_tail
+        container.mux(video.encode())
+
+        if music is not None:
+            for frame in music.decode(music.streams.audio[0]):
+                if frame.time is not None and frame.time >= total_duration:
+                    break
+                frame.pts = None
+                container.mux(audio.encode(frame))
+            container.mux(audio.encode())
+    finally:
+        container.close()
+        if music is not None:
+            music.close()
+
+
+async def build_ffmpeg_command(
+    specs: List[SegmentSpec],
+    music_file_path: Optional[str],
+    duration_per_image: float,
+    crossfade_duration: float,
+    total_duration: float,
+    temp_dir: str,
+    output_path: str,
+) -> List[str]:
+    """
+    ffmpeg arguments rendering the whole slideshow in one filter graph: Ken Burns per
+    image, crossfades between them, captions, and the music track, so every frame
+    goes through the encoder exactly once. Writes the captions file into temp_dir.
+    """
+    total_frames = int(duration_per_image * VIDEO_FPS)
+    input_args: List[str] = []
+    filters: List[str] = []
+    # One input per distinct image; repeats are split inside the graph rather
+    # than decoded again
+    input_index: Dict[str, int] = {}
+    split_labels: Dict[str, List[str]] = {}
+    image_paths = [spec.image_path for spec in specs]
+    for img_path in image_paths:
+        if img_path in input_index:
+            continue
+        n = input_index[img_path] = len(input_index)
+        lowres = jpeg_lowres(img_path)
+        if lowres:
+            input_args += ["-lowres", str(lowres)]
+        input_args += ["-i", img_path]
+        uses = image_paths.count(img_path)
+        if uses > 1:
+            split_labels[img_path] = [f"i{n}_{k}" for k in range(uses)]
+            filters.append(f"[{n}:v]split={uses}" + "".join(f"[{label}]" for label in split_labels[img_path]))
+    video = "s0"
+    for idx, spec in enumerate(specs):
+        img_path = spec.image_path
+        src = split_labels[img_path].pop(0) if img_path in split_labels else f"{input_index[img_path]}:v"
+        filters.append(build_segment(idx, total_frames, src, spec.ken_burns))
+        if idx > 0:
+            # Offset is where this image starts: each previous image minus its crossfade
+            filters.append(_XFADE_FILTER.format(
+                prev=video,
+                idx=idx,
+                duration=crossfade_duration,
+                offset=(duration_per_image - crossfade_duration) * idx,
+            ))
+            video = f"x{idx}"
     
-    for word in words:
-        word_length = len(word)
-        # +1 for space before word
-        if current_length + word_length + (1 if current_line else 0) <= max_chars_per_line:
-            current_line.append(word)
-            current_length += word_length + (1 if len(current_line) > 1 else 0)
+    # Burn in all captions with one ass filter over the finished video
+    ass_path = write_captions_ass(
+        os.path.join(temp_dir, "captions.ass"),
+        [spec.caption for spec in specs],
+        duration_per_image,
+        crossfade_duration,
+    )
+    fontsdir = f":fontsdir='{SLIDESHOW_FONTS_DIR}'" if SLIDESHOW_FONTS_DIR else ""
+    filters.append(f"[{video}]ass=filename='{ass_path}'{fontsdir}[vout]")
+    
+    output_options = video_encoder_options(await get_video_encoder())
+    map_args = ["-map", "[vout]"]
+    if music_file_path and os.path.exists(music_file_path):
+        logger.info("Adding music track...")
+        # Cap the audio at the video length: -shortest alone lets audio, which is
+        # produced much faster than the filtered video, run past the last frame
+        input_args += ["-t", str(total_duration), "-i", music_file_path]
+        map_args += ["-map", f"{len(input_index)}:a"]
+        output_options["shortest"] = None
+        # AAC music (MusicGen returns WAV today) goes into the MP4 as is
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(_io_executor, _audio_codec, music_file_path) == "aac":
+            output_options["acodec"] = "copy"
         else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-            current_length = word_length
+            output_options.update({"acodec": "aac", "b:a": "192k"})
     
-    if current_line:
-        lines.append(' '.join(current_line))
+    threads = _ffmpeg_threads()
+    output_options["threads"] = threads
+    # moov atom up front so the uploaded video starts playing before it's fully downloaded
+    output_options["movflags"] = "+faststart"
     
-    return '\n'.join(lines)
+    return [
+        "-filter_complex_threads", str(threads),
+        *input_args,
+        "-filter_complex", ";".join(filters),
+        *map_args,
+        *_option_args(output_options),
+        output_path,
+    ]
+
+
+def remove_in_background(path: str) -> None:
+    """
+    Delete a scratch file or directory in the I/O pool without waiting for it, so
+    unlinking never delays the job; the outcome is logged when it finishes.
+    """
+    def _remove() -> None:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    
+    def _done(future) -> None:
+        error = future.exception()
+        if error is not None:
+            logger.warning("Failed to cleanup %s: %s", path, error)
+        else:
+            logger.info("Cleaned up %s", path)
+    
+    _io_executor.submit(_remove).add_done_callback(_done)
 
 
 async def create_slideshow(
     images: List[str],
     captions: List[Dict[str, str]],
-    music_file_path: Optional[str] = None,
+    music_file_path: Optional[Union[str, Awaitable[Optional[str]]]] = None,
     duration_per_image: float = 4.0,
     output_path: Optional[str] = None
 ) -> Dict[str, any]:
     """
-    Create a slideshow video with Ken Burns effects, captions, and music using ffmpeg-python.
+    Create a slideshow video with Ken Burns effects, captions, and music in a single ffmpeg (or PyAV) render.
     Handles different image resolutions and aspect ratios.
     
     Args:
         images: List of image URLs or local paths
         captions: List of dicts with 'image_url' and 'caption' keys
-        music_file_path: Path to music audio file (optional)
+        music_file_path: Path to music audio file (optional), or an awaitable of it,
+            awaited once the images are fetched so downloads overlap its generation
         duration_per_image: Duration each image is shown (seconds)
-        output_path: Where to save the output video (defaults to /tmp)
+        output_path: Where to save the output video (defaults to SLIDESHOW_TMPDIR)
     
     Returns:
         Dictionary with:
@@ -173,259 +973,173 @@ async def create_slideshow(
         raise ValueError("No images provided for slideshow")
     
     # Setup paths
-    temp_dir = "/tmp/slideshow_" + uuid.uuid4().hex[:8]
+    temp_dir = os.path.join(SLIDESHOW_TMPDIR, "slideshow_" + uuid.uuid4().hex[:8])
     os.makedirs(temp_dir, exist_ok=True)
     
     if output_path is None:
-        output_path = f"/tmp/slideshow_{uuid.uuid4().hex[:8]}.mp4"
+        # Written once, straight from the render, next to the scratch files (tmpfs
+        # where available) and read back only by the upload
+        output_path = os.path.join(SLIDESHOW_TMPDIR, f"slideshow_{uuid.uuid4().hex[:8]}.mp4")
     
     try:
         # Step 1: Download and preprocess all images
-        print(f"[SLIDESHOW] Downloading and preprocessing {len(images)} images...")
-        processed_images = []
+        logger.info("Downloading and preprocessing %d images...", len(images))
+        
+        download_slots = asyncio.Semaphore(SLIDESHOW_DOWNLOAD_CONCURRENCY)
         
-        for idx, img_url in enumerate(images):
-            # Download image
-            downloaded_path = os.path.join(temp_dir, f"raw_{idx:03d}.jpg")
+        async def _download_and_prep(idx: int, img_url: str) -> str:
+            # Download image (no extension: ffmpeg then detects the format from the content)
+            downloaded_path = os.path.join(temp_dir, f"raw_{idx:03d}")
+            processed_path = os.path.join(temp_dir, f"processed_{idx:03d}.png")
             if img_url.startswith("http"):
-                await download_image(img_url, downloaded_path)
+                async with download_slots:
+                    source = await download_image(img_url, downloaded_path)
+                if isinstance(source, bytes):
+                    # HEIC by content type: decoded straight from memory, only the result is written
+                    return await preprocess_image(source, processed_path)
             else:
                 # Local path - copy it
-                import shutil
                 shutil.copy(img_url, downloaded_path)
             
-            # Preprocess to handle different resolutions/aspect ratios
-            processed_path = os.path.join(temp_dir, f"processed_{idx:03d}.jpg")
+            # ffmpeg scales and crops in the render graph; only images it can't
+            # render correctly go through Pillow first
+            if not needs_pillow_preprocess(downloaded_path):
+                return downloaded_path
             await preprocess_image(downloaded_path, processed_path)
-            processed_images.append(processed_path)
+            return processed_path
         
-        # Step 2: Create caption mapping
-        caption_map = {c["image_url"]: c["caption"] for c in captions}
+        loop = asyncio.get_running_loop()
+        use_cache = bool(SLIDESHOW_IMAGE_CACHE_DIR)
         
-        # Step 3: Create video segments with Ken Burns effect and captions
-        print(f"[SLIDESHOW] Creating {len(processed_images)} video segments with Ken Burns effect...")
-        segment_files = []
-        
-        for idx, (img_path, img_url) in enumerate(zip(processed_images, images)):
-            segment_path = os.path.join(temp_dir, f"segment_{idx:03d}.mp4")
-            caption_text = caption_map.get(img_url, "")
-            
-            # Get Ken Burns parameters
-            kb_params = get_ken_burns_params(duration_per_image)
-            fps = kb_params["fps"]
-            total_frames = int(duration_per_image * fps)
-            zoom_start = kb_params["zoom_start"]
-            zoom_end = kb_params["zoom_end"]
-            width = kb_params["width"]
-            height = kb_params["height"]
-            
-            # Wrap text for better display on mobile
-            wrapped_caption = wrap_text(caption_text, max_chars_per_line=35)
-            
-            # Escape special characters in caption for FFmpeg
-            safe_caption = wrapped_caption.replace("'", "'\\\\\\''").replace(":", "\\:")
-            
+        async def _fetch_and_prep(idx: int, img_url: str) -> str:
+            if not (use_cache and img_url.startswith("http")):
+                return await _download_and_prep(idx, img_url)
+            cached_path = os.path.join(temp_dir, f"cached_{idx:03d}")
+            if await loop.run_in_executor(_io_executor, _restore_cached_image, img_url, cached_path):
+                return cached_path
+            image_path = await _download_and_prep(idx, img_url)
             try:
-                # Create segment using ffmpeg-python with Ken Burns effect
-                stream = ffmpeg.input(img_path, loop=1, framerate=fps)
-                
-                # Apply Ken Burns zoom effect with correct initial zoom
-                # Use linear interpolation from zoom_start to zoom_end
-                zoom_formula = f'{zoom_start}+({zoom_end}-{zoom_start})*(on/{total_frames})'
-                stream = stream.filter(
-                    'zoompan',
-                    z=zoom_formula,
-                    d=total_frames,
-                    s=f'{width}x{height}',
-                    fps=fps
-                )
-                
-                # Add caption with text wrapping using max_glyph_w for wrapping
-                stream = stream.drawtext(
-                    text=safe_caption,
-                    fontcolor='white',
-                    fontsize=40,
-                    borderw=3,
-                    bordercolor='black@0.8',
-                    x='(w-text_w)/2',
-                    y='h-th-80',  # 80px from bottom
-                    box=1,
-                    boxcolor='black@0.5',
-                    boxborderw=20,
-                    line_spacing=8,
-                    fontfile='/System/Library/Fonts/Supplemental/Arial.ttf'
-                )
-                
-                stream = stream.output(
-                    segment_path,
-                    vcodec='libx264',
-                    pix_fmt='yuv420p',
-                    frames=total_frames,  # Explicit frame count for exact duration
-                    **{'b:v': '3M'}  # Set bitrate for quality
-                )
-                
-                stream = stream.overwrite_output()
-                
-                await run_ffmpeg_async(stream)
-                segment_files.append(segment_path)
-                
-            except ffmpeg.Error as e:
-                error_msg = e.stderr.decode() if e.stderr else str(e)
-                raise RuntimeError(f"FFmpeg failed for segment {idx}: {error_msg}")
+                await loop.run_in_executor(_io_executor, _store_cached_image, img_url, image_path)
+            except OSError as e:
+                logger.warning("Failed to cache image %s: %s", img_url, e)
+            return image_path
         
-        # Step 4: Concatenate all segments with crossfade transitions
-        print(f"[SLIDESHOW] Concatenating {len(segment_files)} segments with crossfade transitions...")
+        await prewarm_dns(images)
         
-        temp_video_no_audio = os.path.join(temp_dir, "video_no_audio.mp4")
+        # All downloads overlap; an image used more than once is fetched once, and
+        # gather keeps results in order
+        unique_images = list(dict.fromkeys(images))
+        fetched = await asyncio.gather(
+            *(_fetch_and_prep(idx, img_url) for idx, img_url in enumerate(unique_images))
+        )
+        path_for = dict(zip(unique_images, fetched))
+        processed_images = [path_for[img_url] for img_url in images]
+        if use_cache:
+            try:
+                await loop.run_in_executor(_io_executor, _evict_image_cache)
+            except OSError as e:
+                logger.warning("Failed to evict image cache: %s", e)
         
-        try:
-            if len(segment_files) == 1:
-                # Single segment - just copy it
-                import shutil
-                shutil.copy(segment_files[0], temp_video_no_audio)
-            else:
-                # Multiple segments - apply crossfade between them
-                crossfade_duration = 0.5  # 0.5 second crossfade
-                
-                # Build complex filter for crossfading
-                inputs = [ffmpeg.input(seg) for seg in segment_files]
-                
-                # Start with first video
-                video = inputs[0].video
-                
-                # Apply crossfade between consecutive videos
-                for i in range(1, len(inputs)):
-                    # Calculate offset (duration of previous segment minus crossfade)
-                    offset = duration_per_image - crossfade_duration
-                    
-                    video = ffmpeg.filter(
-                        [video, inputs[i].video],
-                        'xfade',
-                        transition='fade',
-                        duration=crossfade_duration,
-                        offset=offset * i
-                    )
-                
-                stream = ffmpeg.output(
-                    video,
-                    temp_video_no_audio,
-                    vcodec='libx264',
-                    pix_fmt='yuv420p',
-                    **{'b:v': '3M'}
-                ).overwrite_output()
-                
-                await run_ffmpeg_async(stream)
-            
-        except ffmpeg.Error as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
-            raise RuntimeError(f"FFmpeg concat failed: {error_msg}")
+        if music_file_path is not None and not isinstance(music_file_path, str):
+            music_file_path = await music_file_path
         
-        # Step 5: Add music if provided
-        if music_file_path and os.path.exists(music_file_path):
-            print(f"[SLIDESHOW] Adding music track...")
-            
-            try:
-                video_stream = ffmpeg.input(temp_video_no_audio)
-                audio_stream = ffmpeg.input(music_file_path)
-                
-                stream = (
-                    ffmpeg
-                    .output(video_stream, audio_stream, output_path, 
-                           vcodec='copy', acodec='aac', audio_bitrate='192k', 
-                           shortest=None)
-                    .overwrite_output()
-                )
-                
-                await run_ffmpeg_async(stream)
-                
-            except ffmpeg.Error as e:
-                error_msg = e.stderr.decode() if e.stderr else str(e)
-                raise RuntimeError(f"FFmpeg audio merge failed: {error_msg}")
+        # Step 2: Caption text per image. process_slideshow builds images from captions, so
+        # they line up by position (which also keeps distinct captions for repeated
+        # URLs); only map by URL when a caller passes them unaligned
+        if len(captions) == len(images) and all(c["image_url"] == u for c, u in zip(captions, images)):
+            caption_texts = [c["caption"] for c in captions]
         else:
-            # No music, just copy the video
-            import shutil
-            shutil.copy(temp_video_no_audio, output_path)
+            caption_map = {c["image_url"]: c["caption"] for c in captions}
+            caption_texts = [caption_map.get(img_url, "") for img_url in images]
+        
+        # Step 3: Everything each segment needs, settled up front so the render is
+        # built in one go (and outside the render slot)
+        crossfade_duration = 0.5  # 0.5 second crossfade
+        specs = [
+            SegmentSpec(img_path, text, get_ken_burns_params())
+            for img_path, text in zip(processed_images, caption_texts)
+        ]
         
         # Calculate total duration accounting for crossfades
         # Each crossfade overlaps 0.5s, so subtract that from total
-        crossfade_duration = 0.5
         num_transitions = max(0, len(images) - 1)
         total_duration = (len(images) * duration_per_image) - (num_transitions * crossfade_duration)
         
-        print(f"[SLIDESHOW] Successfully created slideshow: {output_path}")
-        print(f"[SLIDESHOW] Duration: {total_duration}s, Images: {len(images)}, Format: 1080x1920 (9:16)")
+        use_pyav = SLIDESHOW_RENDERER == "pyav" and _pyav_available()
+        if not use_pyav:
+            command = await build_ffmpeg_command(
+                specs, music_file_path, duration_per_image, crossfade_duration,
+                total_duration, temp_dir, output_path,
+            )
+        
+        # Only the render itself holds a slot; queued jobs fetch their images meanwhile
+        async with _render_slots:
+            logger.info("Rendering %d images with Ken Burns effect and crossfades...", len(processed_images))
+            if use_pyav:
+                await get_video_encoder()
+                await loop.run_in_executor(
+                    _executor, _render_pyav_sync, specs, music_file_path,
+                    duration_per_image, crossfade_duration, total_duration, output_path,
+                )
+            else:
+                await run_ffmpeg_async(command)
+        
+        logger.info("Successfully created slideshow: %s", output_path)
+        logger.info("Duration: %ss, Images: %d, Format: 1080x1920 (9:16)", total_duration, len(images))
         
         return {
             "video_path": output_path,
             "duration": total_duration,
-            "width": 1080,
-            "height": 1920
+            "width": VIDEO_WIDTH,
+            "height": VIDEO_HEIGHT
         }
         
     except Exception as e:
+        # Don't leave a partial render behind (it may be sitting in tmpfs)
+        if os.path.exists(output_path):
+            remove_in_background(output_path)
         raise RuntimeError(f"Failed to create slideshow: {str(e)}")
     
     finally:
         # Cleanup temporary files
-        try:
-            import shutil
-            shutil.rmtree(temp_dir)
-            print(f"[SLIDESHOW] Cleaned up temporary directory: {temp_dir}")
-        except Exception as e:
-            print(f"[SLIDESHOW] WARNING: Failed to cleanup temp dir: {str(e)}")
+        remove_in_background(temp_dir)
 
 async def process_slideshow(job_id: str, request: SlideshowRequest, user_id: int):
     """
     Background task to process slideshow generation with stage-based status updates.
     """
+    local_video_path: Optional[str] = None
     try:
         event_id = request.event_id
         music_choice = request.music_choice
         theme_prompt = request.theme_prompt
         
-        # Stage 1: Fetching images and generating captions
-        job_status_store[job_id] = {
-            "status": "processing",
-            "message": "Fetching images and generating captions...",
-            "slideshow_url": None,
-            "error": None
-        }
-        print(f"[JOB {job_id}] Stage 1 & 2: Fetching images and generating captions")
-        
-        # Fetch media mapping and generate captions in one call
-        # This returns [{"image_url": "...", "caption": "..."}, ...]
-        captions = await generate_event_captions_batch(
-            event_id=event_id,
-            theme=theme_prompt or "playful",
-            update_database=True  # Save captions to Supabase
+        # Stages 1-3: captions and music only depend on the event and theme, so run them concurrently
+        await set_job_status(
+            job_id,
+            status="processing",
+            message="Fetching images, generating captions and music...",
+            slideshow_url=None,
+            error=None,
         )
+        logger.info("[JOB %s] Stages 1-3: Fetching images, generating captions and music", job_id)
         
-        # Extract image URLs for video generation
-        image_urls = [c["image_url"] for c in captions]
-        
-        print(f"[JOB {job_id}] Fetched {len(image_urls)} images and generated {len(captions)} captions")
-        
-        # Stage 3: Generating music
-        job_status_store[job_id]["message"] = "Generating music..."
-        print(f"[JOB {job_id}] Stage 3: Generating music")
-        
-        music_data = None
-        # Collect participant usernames (for prompt context)
-        try:
-            media_map = await fetch_event_media_mapping(event_id)
-            participants = []
-            for m in media_map:
-                for u in (m.get("tagged_users") or []):
-                    name = u.get("username") or u.get("name") or u.get("display_name")
-                    if name and name not in participants:
-                        participants.append(name)
-        except Exception:
-            participants = []
-        if music_choice:
-            # Music was pre-selected by user
-            music_data = {"file_path": music_choice}  # Assuming music_choice is a URL/path
-            print(f"[JOB {job_id}] Using pre-selected music: {music_choice}")
-        else:
+        async def _music() -> Optional[dict]:
+            if music_choice:
+                # Music was pre-selected by user
+                logger.info("[JOB %s] Using pre-selected music: %s", job_id, music_choice)
+                return {"file_path": music_choice}  # Assuming music_choice is a URL/path
+            # Collect participant usernames (for prompt context)
+            try:
+                media_map = await fetch_event_media_mapping(event_id)
+                participants = []
+                for m in media_map:
+                    for u in (m.get("tagged_users") or []):
+                        name = u.get("username") or u.get("name") or u.get("display_name")
+                        if name and name not in participants:
+                            participants.append(name)
+            except Exception:
+                participants = []
             # Generate music based on theme_prompt
             try:
                 enriched_theme = theme_prompt or "playful"
@@ -433,55 +1147,92 @@ async def process_slideshow(job_id: str, request: SlideshowRequest, user_id: int
                     # Add lightweight context about participants to influence vibe
                     names = ", ".join(participants[:10])  # cap list length
                     enriched_theme = f"{enriched_theme} vibe for a group featuring: {names}"
-                music_data = await generate_music(enriched_theme, duration=30)
-                print(f"[JOB {job_id}] Generated music: {music_data.get('file_path')}")
+                data = await generate_music(enriched_theme, duration=30)
+                logger.info("[JOB %s] Generated music: %s", job_id, data.get('file_path'))
+                return data
             except Exception as e:
-                print(f"[JOB {job_id}] WARNING: Failed to generate music: {str(e)}")
+                logger.warning("[JOB %s] Failed to generate music: %s", job_id, e)
                 # Continue without music rather than failing the entire request
-                music_data = None
+                return None
+        
+        # Music keeps generating through the image downloads; create_slideshow only
+        # waits for it once the images are in
+        music_task = asyncio.create_task(_music())
+        
+        async def _music_path() -> Optional[str]:
+            music_data = await music_task
+            return music_data.get("file_path") if music_data else None
+        
+        def _discard_music() -> None:
+            # The job failed before using the music: stop generating it rather than
+            # waiting, and delete the file if it was already written
+            def _remove(task: asyncio.Task) -> None:
+                if task.cancelled() or task.exception() is not None:
+                    return
+                music_data = task.result()
+                if music_data and not music_choice:
+                    remove_in_background(music_data["file_path"])
+            
+            music_task.cancel()
+            music_task.add_done_callback(_remove)
+        
+        # Fetch media mapping and generate captions in one call
+        # This returns [{"image_url": "...", "caption": "..."}, ...]
+        try:
+            captions = await generate_event_captions_batch(
+                event_id=event_id,
+                theme=theme_prompt or "playful",
+                update_database=True  # Save captions to Supabase
+            )
+        except Exception:
+            _discard_music()
+            raise
+        
+        # Extract image URLs for video generation
+        image_urls = [c["image_url"] for c in captions]
+        
+        logger.info("[JOB %s] Fetched %d images and generated %d captions", job_id, len(image_urls), len(captions))
         
         # Stage 4: Creating video
-        job_status_store[job_id]["message"] = "Creating slideshow video..."
-        print(f"[JOB {job_id}] Stage 4: Creating video")
+        await set_job_status(job_id, message="Creating slideshow video...")
+        logger.info("[JOB %s] Stage 4: Creating video", job_id)
         
         # Create slideshow with Ken Burns effects and captions
-        music_file = music_data.get("file_path") if music_data else None
-        slideshow_result = await create_slideshow(
-            images=image_urls,
-            captions=captions,
-            music_file_path=music_file,
-            duration_per_image=4.0
-        )
+        try:
+            slideshow_result = await create_slideshow(
+                images=image_urls,
+                captions=captions,
+                music_file_path=asyncio.create_task(_music_path()),
+                duration_per_image=4.0
+            )
+        except Exception:
+            # create_slideshow may fail before it ever awaits the music
+            _discard_music()
+            raise
+        music_data = await music_task
         
         local_video_path = slideshow_result["video_path"]
         duration_seconds = int(slideshow_result["duration"])
-        print(f"[JOB {job_id}] Video created locally: {local_video_path}")
+        logger.info("[JOB %s] Video created locally: %s", job_id, local_video_path)
         
         # Cleanup temporary music file if generated
         if music_data and "file_path" in music_data and music_data["file_path"].startswith("/tmp"):
-            try:
-                os.remove(music_data["file_path"])
-                print(f"[JOB {job_id}] Cleaned up temporary music file")
-            except Exception as e:
-                print(f"[JOB {job_id}] WARNING: Failed to cleanup music file: {str(e)}")
+            remove_in_background(music_data["file_path"])
         
         # Stage 5: Uploading to blob storage
-        job_status_store[job_id]["message"] = "Uploading slideshow to storage..."
-        print(f"[JOB {job_id}] Stage 5: Uploading to blob storage")
+        await set_job_status(job_id, message="Uploading slideshow to storage...")
+        logger.info("[JOB %s] Stage 5: Uploading to blob storage", job_id)
         
         slideshow_url = await upload_video_to_blob_storage(local_video_path, event_id)
-        print(f"[JOB {job_id}] Uploaded to: {slideshow_url}")
+        logger.info("[JOB %s] Uploaded to: %s", job_id, slideshow_url)
         
-        # Cleanup local video file
-        try:
-            os.remove(local_video_path)
-            print(f"[JOB {job_id}] Cleaned up temporary video file")
-        except Exception as e:
-            print(f"[JOB {job_id}] WARNING: Failed to cleanup video file: {str(e)}")
+        # Cleanup local video file now rather than after the database save
+        remove_in_background(local_video_path)
+        local_video_path = None
         
         # Stage 6: Saving to database
-        job_status_store[job_id]["message"] = "Saving slideshow metadata..."
-        print(f"[JOB {job_id}] Stage 6: Saving to database")
+        await set_job_status(job_id, message="Saving slideshow metadata...")
+        logger.info("[JOB %s] Stage 6: Saving to database", job_id)
         
         slideshow_id = await save_slideshow_to_database(
             event_id=event_id,
@@ -491,24 +1242,31 @@ async def process_slideshow(job_id: str, request: SlideshowRequest, user_id: int
             music_choice=music_choice,
             duration_seconds=duration_seconds
         )
-        print(f"[JOB {job_id}] Saved to database with ID: {slideshow_id}")
+        logger.info("[JOB %s] Saved to database with ID: %s", job_id, slideshow_id)
         
         # Mark as completed
-        job_status_store[job_id] = {
-            "status": "completed",
-            "message": "Slideshow ready!",
-            "slideshow_url": slideshow_url,
-            "error": None
-        }
-        print(f"[JOB {job_id}] Completed successfully")
+        await set_job_status(
+            job_id,
+            status="completed",
+            message="Slideshow ready!",
+            slideshow_url=slideshow_url,
+            error=None,
+        )
+        logger.info("[JOB %s] Completed successfully", job_id)
         
     except Exception as e:
         # Mark as failed
-        job_status_store[job_id] = {
-            "status": "failed",
-            "message": "Failed to generate slideshow",
-            "slideshow_url": None,
-            "error": str(e)
-        }
-        print(f"[JOB {job_id}] Failed with error: {str(e)}")
+        await set_job_status(
+            job_id,
+            status="failed",
+            message="Failed to generate slideshow",
+            slideshow_url=None,
+            error=str(e),
+        )
+        logger.error("[JOB %s] Failed with error: %s", job_id, e)
+    
+    finally:
+        # Still set only when the job failed between the render and the upload
+        if local_video_path is not None:
+            remove_in_background(local_video_path)
 